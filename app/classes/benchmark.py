@@ -0,0 +1,217 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.config import config, seeded_random as random
+from app.classes.graph.navigation_graph import NavigationGraph
+from app.classes.graph.analyzer import Analyzer
+from app.classes.views import ConsoleView
+from app.classes.views.walk_statistics import WalkStatistics
+
+
+class BenchmarkResult:
+    def __init__(self, name, n_rows, n_cols, n_nodes, n_edges, times, peak_memory):
+        self.name = name
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.n_nodes = n_nodes
+        self.n_edges = n_edges
+        self.times = times
+        self.peak_memory = peak_memory  # Bytes allocated at most during one operation
+
+    def key(self):
+        return self.name, self.n_rows, self.n_cols
+
+    def percentile(self, q):
+        return float(np.percentile(self.times, q))
+
+    def ops_per_sec(self):
+        total = sum(self.times)
+        return len(self.times) / total if total else float("inf")
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'rows': self.n_rows,
+            'cols': self.n_cols,
+            'nodes': self.n_nodes,
+            'edges': self.n_edges,
+            'repeat': len(self.times),
+            'ops_per_sec': self.ops_per_sec(),
+            'mean': float(np.mean(self.times)),
+            'min': float(np.min(self.times)),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'peak_memory': self.peak_memory,
+            }
+
+    def __repr__(self):
+        return "{:<20} {:>3}x{:<3} {:>12.1f} ops/s  p50 {:>9.3f} ms  p90 {:>9.3f} ms  p99 {:>9.3f} ms  peak {:>9.1f} KiB"\
+            .format(self.name, self.n_rows, self.n_cols, self.ops_per_sec(), self.percentile(50) * 1000,
+                    self.percentile(90) * 1000, self.percentile(99) * 1000, self.peak_memory / 1024)
+
+
+class BenchmarkSuite:
+    # Times the hot paths of the pathfinders, the analyzer and the console sweep on headless grids from
+    # generate_viewless_grid. Every size is built from the same seed, so runs of different revisions
+    # measure the same graphs and paths and their JSON files can be compared.
+    benchmark_names = ['create_path', 'waypoint_paths', 'score_path', 'perform_walk', 'update_node_labels']
+
+    def __init__(self, sizes=((10, 10), (20, 20), (40, 40)), repeat=20, walk_batch=20,
+                 seed=config.world.default_rand_seed, names=None):
+        self.sizes = sizes
+        self.repeat = repeat
+        self.walk_batch = walk_batch    # Walks per perform_walk operation
+        self.seed = seed
+        self.names = names if names else self.benchmark_names
+        self.results = []
+
+    @staticmethod
+    def measure(function, repeat, setup=None):
+        # Returns the time of each call and the peak traced memory of one extra, untimed call
+        times = []
+        for i in range(repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            function()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return times, peak_memory
+
+    def create_nav_graph(self, n_rows, n_cols):
+        random.seed(self.seed)
+        nav_graph = NavigationGraph()
+        nav_graph.set_no_visuals(no_visuals=True)
+        nav_graph.generate_viewless_grid(n_rows, n_cols, make_hex=False)
+        nodes = nav_graph.graph.nodes()
+        nav_graph.set_start_node(nodes[0])
+        nav_graph.set_destination_node(nodes[-1])
+        nav_graph.pathfinder.update_to_new_path()
+        return nav_graph
+
+    def run(self, print_results=True):
+        self.results = []
+        for n_rows, n_cols in self.sizes:
+            for name in self.names:
+                result = getattr(self, 'bench_' + name)(n_rows, n_cols)
+                if result is None:
+                    continue
+                self.results.append(result)
+                if print_results:
+                    print(result)
+        return self.results
+
+    def _result(self, name, n_rows, n_cols, graph, times_and_peak):
+        times, peak_memory = times_and_peak
+        return BenchmarkResult(name, n_rows, n_cols, graph.number_of_nodes(), graph.number_of_edges(),
+                               times, peak_memory)
+
+    def bench_create_path(self, n_rows, n_cols):
+        nav_graph = self.create_nav_graph(n_rows, n_cols)
+        measured = self.measure(nav_graph.pathfinder.create_path, self.repeat)
+        return self._result('create_path', n_rows, n_cols, nav_graph.graph, measured)
+
+    def bench_waypoint_paths(self, n_rows, n_cols):
+        nav_graph = self.create_nav_graph(n_rows, n_cols)
+        path_nodes = nav_graph.pathfinder.get_path_nodes()
+        if len(path_nodes) < 4:
+            return None
+        # Waypoints off the path, so every leg is searched for
+        candidates = [node for node in nav_graph.graph.nodes() if node not in path_nodes]
+        if len(candidates) < 3:
+            return None
+        nav_graph.pathfinder.add_waypoint(candidates[len(candidates)//3])
+        nav_graph.pathfinder.add_waypoint(candidates[2*len(candidates)//3])
+        measured = self.measure(nav_graph.pathfinder.assemble_waypoint_paths, self.repeat)
+        return self._result('waypoint_paths', n_rows, n_cols, nav_graph.graph, measured)
+
+    def bench_score_path(self, n_rows, n_cols):
+        nav_graph = self.create_nav_graph(n_rows, n_cols)
+        analyzer = Analyzer(nav_graph)
+        measured = self.measure(analyzer.score_path, self.repeat)
+        return self._result('score_path', n_rows, n_cols, nav_graph.graph, measured)
+
+    def bench_perform_walk(self, n_rows, n_cols):
+        random.seed(self.seed)
+        view = ConsoleView()
+        view.show_progress = False
+        view.stats = WalkStatistics()    # No result file
+        view.walk_data_key.n_rows = n_rows
+        view.walk_data_key.n_cols = n_cols
+        path_nodes = view.create_until_path(n_rows, n_cols)
+        nodes = view.nav_graph.graph.nodes()
+        n_evils = max(1, min(view.get_n_evils_so(p_walk_ok=0.5), len(nodes) - 1))
+
+        def walk_batch():
+            for walk_i in range(self.walk_batch):
+                view.walk_data_key.walk_i = walk_i
+                view.perform_walk(nodes, path_nodes, n_evils)
+        measured = self.measure(walk_batch, self.repeat)
+        return self._result('perform_walk', n_rows, n_cols, view.nav_graph.graph, measured)
+
+    def bench_update_node_labels(self, n_rows, n_cols):
+        nav_graph = self.create_nav_graph(n_rows, n_cols)
+        nodes = nav_graph.graph.nodes()
+
+        def clear_labels():
+            # As after inserting all nodes at once
+            for node in nodes:
+                node.set_label(None)
+        measured = self.measure(nav_graph.update_node_labels, self.repeat, setup=clear_labels)
+        return self._result('update_node_labels', n_rows, n_cols, nav_graph.graph, measured)
+
+    @staticmethod
+    def get_revision():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                           stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def save(self, filename):
+        data = {
+            'revision': self.get_revision(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': self.repeat,
+            'results': [result.to_dict() for result in self.results],
+            }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    def compare(self, baseline_filename, threshold=0.1, print_results=True):
+        # Returns the benchmarks whose median time grew by more than threshold relative to the baseline
+        with open(baseline_filename, encoding='utf-8') as f:
+            baseline = json.load(f)
+        baseline_results = {(result['name'], result['rows'], result['cols']): result
+                            for result in baseline['results']}
+        regressions = []
+        if print_results:
+            print("Compared to {} ({}):".format(baseline_filename, baseline.get('revision')))
+        for result in self.results:
+            old = baseline_results.get(result.key())
+            if not old or not old['p50']:
+                continue
+            ratio = result.percentile(50) / old['p50']
+            regressed = ratio > 1 + threshold
+            if regressed:
+                regressions.append(result)
+            if print_results:
+                print("{:<20} {:>3}x{:<3} p50 {:>9.3f} -> {:>9.3f} ms  x{:.2f}{}".format(
+                    result.name, result.n_rows, result.n_cols, old['p50'] * 1000, result.percentile(50) * 1000,
+                    ratio, '  REGRESSION' if regressed else ''))
+        return regressions
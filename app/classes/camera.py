@@ -0,0 +1,53 @@
+import pyglet
+
+from app.config import config
+
+
+class Camera:
+    # Pan and zoom of a window over the world. World coordinates are those of the graph, screen coordinates
+    # those of the window and its mouse events.
+    def __init__(self, width, height):
+        self.x = 0.0    # World position at the bottom left corner of the window
+        self.y = 0.0
+        self.zoom = 1.0
+        self.width = width
+        self.height = height
+
+    def set_size(self, width, height):
+        self.width = width
+        self.height = height
+
+    def reset(self):
+        self.x = self.y = 0.0
+        self.zoom = 1.0
+
+    def pan(self, dx, dy):
+        # Moves the view along with a drag of dx, dy screen pixels
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+
+    def zoom_at(self, screen_point, factor):
+        # Zooms while keeping the world point under screen_point in place
+        world_x, world_y = self.screen_to_world(screen_point)
+        self.zoom = min(max(self.zoom * factor, config.window.min_zoom), config.window.max_zoom)
+        self.x = world_x - screen_point[0] / self.zoom
+        self.y = world_y - screen_point[1] / self.zoom
+
+    def screen_to_world(self, point):
+        return self.x + point[0] / self.zoom, self.y + point[1] / self.zoom
+
+    def world_to_screen(self, point):
+        return (point[0] - self.x) * self.zoom, (point[1] - self.y) * self.zoom
+
+    def get_view_rect(self):
+        # (x_min, y_min, x_max, y_max) of the world within the window
+        return self.x, self.y, self.x + self.width / self.zoom, self.y + self.height / self.zoom
+
+    def begin(self):
+        gl = pyglet.gl
+        gl.glPushMatrix()
+        gl.glScalef(self.zoom, self.zoom, 1.0)
+        gl.glTranslatef(-self.x, -self.y, 0.0)
+
+    def end(self):
+        pyglet.gl.glPopMatrix()
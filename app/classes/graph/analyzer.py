@@ -1,41 +1,55 @@
 from app.config import config, seeded_random as random
 from app.pythomas import pythomas as lib
 from app.classes.graph.analysis import Analysis
+from app.classes.graph.replacement_paths import ReplacementPaths
 
 
 class Analyzer:
     def __init__(self, nav_graph):
         self.nav_graph = nav_graph
+        self.replacement_paths = ReplacementPaths(nav_graph.compact_graph)
+        # Score all blocked nodes from two shortest-path trees, searching around a node only where the trees
+        # can not prove its detour. The costs equal those of blocking. When disabled, or when the path is not
+        # a shortest path (e.g. through waypoints), each node is blocked in turn and the path re-searched.
+        self.use_replacement_paths = True
 
     def score_path(self):
         path = self.nav_graph.pathfinder.get_path()
         nodes = self.nav_graph.pathfinder.get_path_nodes()
         if len(nodes) < 3:
             return None
-        edges = self.nav_graph.pathfinder.get_path_edges()
         base_cost = self.nav_graph.pathfinder.get_path_cost()
-        # base_costs = dict()
-        # for edge in edges:
-        #     base_costs[edge] = self.nav_graph.pathfinder.read_edge_cost(edge)
+        detour_costs = None
+        if self.use_replacement_paths and not self.nav_graph.pathfinder.waypoints:
+            detour_costs = self.replacement_paths.compute(nodes)
+        if detour_costs is None:
+            detour_costs = self.get_detour_costs_by_blocking(nodes)
+
         infinity = float("inf")
         irreplaceable_nodes = []
         costs = dict()
         block_chances = dict()
-        for i in range(1, len(nodes)-1):
-            predecessor = nodes[i-1]
-            node = nodes[i]
-            self.nav_graph.add_occupant(node)
-            cost = self.nav_graph.pathfinder.get_path_cost()
+        for node in nodes[1:-1]:
+            cost = detour_costs[node]
             if not cost or cost == infinity:
                 irreplaceable_nodes.append(node)
                 costs[node] = base_cost
             else:
                 costs[node] = cost
             block_chances[node] = 1 / (len(nodes) - 2)
-            self.nav_graph.remove_occupant(node)
         chance_of_open = 1
         for node in irreplaceable_nodes:
             chance_of_open *= (1-block_chances[node])
         expected_cost = sum(costs[node]*block_chances[node] for node in nodes[1:-1])
         analysis = Analysis(path, base_cost, expected_cost, irreplaceable_nodes, chance_of_open)
         return analysis
+
+    def get_detour_costs_by_blocking(self, nodes):
+        detour_costs = dict()
+        for i in range(1, len(nodes)-1):
+            node = nodes[i]
+            self.nav_graph.add_occupant(node)
+            detour_costs[node] = self.nav_graph.pathfinder.get_path_cost()
+            self.nav_graph.remove_occupant(node)
+            self.nav_graph.pathfinder.update_to_new_path()  # Restore the unblocked path before the next node
+        return detour_costs
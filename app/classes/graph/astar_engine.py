@@ -0,0 +1,203 @@
+from heapq import heappush, heappop
+from itertools import count
+
+from app.classes.graph.compact_graph import CompactGraph
+from app.classes.graph.landmarks import Landmarks
+
+
+class AStarEngine:
+    # A* over the integer ids and CSR arrays of a CompactGraph, with the Euclidean distance heuristic.
+    # The g-score and parent lists are allocated once and reused by every query: an entry is only valid when its
+    # generation stamp equals the generation of the current query, so nothing is cleared between queries.
+    # The heuristic of all nodes is one vectorized distance-to-target call, cached until the graph changes.
+    # With landmarks set, the tighter ALT bounds of Landmarks are used instead.
+    # search_bidirectional runs a forward and a reverse search at the same time, see there.
+    def __init__(self, compact_graph):
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
+        self.landmarks = None
+        if False:
+            self.landmarks = Landmarks(compact_graph)
+        self.generation = 0
+        self._g_scores = []
+        self._parents = []      # Set when an id is expanded, from the queue entry it was expanded with
+        self._seen = []         # Generation in which the g-score of an id was set
+        self._closed = []       # Generation in which an id was expanded
+        # The same for the reverse search of search_bidirectional
+        self._reverse_g_scores = []
+        self._reverse_parents = []
+        self._reverse_seen = []
+        self._reverse_closed = []
+        self._heuristics = None
+        self._heuristics_key = None     # (target id, graph version) of the cached heuristics
+        self._potentials = None
+        self._potentials_key = None     # (source id, target id, graph version) of the cached potentials
+        self.expanded_count = 0         # Expansions of the last query
+
+    def _prepare(self):
+        size = self.compact_graph.get_size()
+        missing = size - len(self._g_scores)
+        if missing > 0:
+            self._g_scores.extend([0.0] * missing)
+            self._parents.extend([-1] * missing)
+            self._seen.extend([0] * missing)
+            self._closed.extend([0] * missing)
+            self._reverse_g_scores.extend([0.0] * missing)
+            self._reverse_parents.extend([-1] * missing)
+            self._reverse_seen.extend([0] * missing)
+            self._reverse_closed.extend([0] * missing)
+        self.generation += 1
+        return self.generation
+
+    def set_landmarks(self, landmarks):
+        self.landmarks = landmarks
+        self._heuristics_key = self._potentials_key = None
+
+    def get_lower_bounds(self, node_id, reverse=False):
+        # Lower bounds of the distances from every id to node_id, or with reverse=True from node_id to every id
+        if self.landmarks is not None:
+            return self.landmarks.get_lower_bounds(node_id, reverse)
+        return self.compact_graph.distances_to(node_id)
+
+    def get_heuristics(self, target_id):
+        key = target_id, self.compact_graph.version
+        if self._heuristics_key != key:
+            self._heuristics = self.get_lower_bounds(target_id).tolist()
+            self._heuristics_key = key
+        return self._heuristics
+
+    def get_potentials(self, source_id, target_id):
+        # Average of the bound to the target and minus the bound from the source
+        key = source_id, target_id, self.compact_graph.version
+        if self._potentials_key != key:
+            to_target = self.get_lower_bounds(target_id)
+            from_source = self.get_lower_bounds(source_id, reverse=True)
+            self._potentials = ((to_target - from_source) / 2).tolist()
+            self._potentials_key = key
+        return self._potentials
+
+    def search(self, source_id, target_id):
+        # Returns the ids of a shortest path, or an empty list when the target is unreachable.
+        # Ties are broken in insertion order, as in nx.astar_path.
+        generation = self._prepare()
+        g_scores, parents, seen, closed = self._g_scores, self._parents, self._seen, self._closed
+        indptr, indices, weights = self.compact_graph.csr_lists()
+        heuristics = self.get_heuristics(target_id)
+
+        c = count()
+        g_scores[source_id] = 0.0
+        seen[source_id] = generation
+        queue = [(0, next(c), source_id, 0.0, -1)]
+        expanded_count = 0
+        while queue:
+            _, __, current, dist, parent = heappop(queue)
+            if current == target_id:
+                parents[current] = parent
+                self.expanded_count = expanded_count
+                return self.get_path(current)
+            if closed[current] == generation:
+                continue
+            closed[current] = generation
+            parents[current] = parent
+            expanded_count += 1
+            for i in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[i]
+                if closed[neighbor] == generation:
+                    continue
+                ncost = dist + weights[i]
+                if seen[neighbor] == generation and g_scores[neighbor] <= ncost:
+                    continue
+                g_scores[neighbor] = ncost
+                seen[neighbor] = generation
+                heappush(queue, (ncost + heuristics[neighbor], next(c), neighbor, ncost, current))
+        self.expanded_count = expanded_count
+        return []
+
+    def search_bidirectional(self, source_id, target_id):
+        # Bidirectional A*: the forward search expands successors from the source, the reverse search predecessors
+        # from the target. Both use the average potential p of get_potentials, with keys g + p forward and g - p in
+        # reverse, which keeps them consistent on directed graphs whose edges cost at least their Euclidean length.
+        # A path through v then costs forward key + reverse key, so once the smallest keys of the two queues sum
+        # to at least the cheapest path found, no cheaper path is left. Paths over blocked (infinite cost) edges are
+        # only returned when there is no other, as by search.
+        # Returns the ids of a shortest path, or an empty list when the target is unreachable.
+        if source_id == target_id:
+            self.expanded_count = 0
+            return [source_id]
+        generation = self._prepare()
+        potentials = self.get_potentials(source_id, target_id)
+        infinity = float("inf")
+        forward = (self._g_scores, self._parents, self._seen, self._closed, self.compact_graph.csr_lists(), 1)
+        reverse = (self._reverse_g_scores, self._reverse_parents, self._reverse_seen, self._reverse_closed,
+                   self.compact_graph.reverse_csr_lists(), -1)
+        for (g_scores, parents, seen, closed, csr, sign), root in ((forward, source_id), (reverse, target_id)):
+            g_scores[root] = 0.0
+            parents[root] = -1
+            seen[root] = generation
+        forward_queue = [(potentials[source_id], source_id)]
+        reverse_queue = [(-potentials[target_id], target_id)]
+        best_cost = infinity
+        meeting_id = -1
+        expanded_count = 0
+        while forward_queue and reverse_queue:
+            if meeting_id != -1 and forward_queue[0][0] + reverse_queue[0][0] >= best_cost:
+                break
+            if forward_queue[0][0] <= reverse_queue[0][0]:
+                queue, (g_scores, parents, seen, closed, csr, sign) = forward_queue, forward
+                other_g_scores, other_seen = self._reverse_g_scores, self._reverse_seen
+            else:
+                queue, (g_scores, parents, seen, closed, csr, sign) = reverse_queue, reverse
+                other_g_scores, other_seen = self._g_scores, self._seen
+            _, current = heappop(queue)
+            if closed[current] == generation:
+                continue
+            closed[current] = generation
+            expanded_count += 1
+            indptr, indices, weights = csr
+            dist = g_scores[current]
+            for i in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[i]
+                ncost = dist + weights[i]
+                if seen[neighbor] == generation and g_scores[neighbor] <= ncost:
+                    continue
+                g_scores[neighbor] = ncost
+                parents[neighbor] = current
+                seen[neighbor] = generation
+                heappush(queue, (ncost + sign * potentials[neighbor], neighbor))
+                if other_seen[neighbor] == generation and \
+                        (meeting_id == -1 or ncost + other_g_scores[neighbor] < best_cost):
+                    best_cost = ncost + other_g_scores[neighbor]
+                    meeting_id = neighbor
+        self.expanded_count = expanded_count
+        if meeting_id == -1:
+            return []
+        path = self.get_path(meeting_id)
+        node_id = self._reverse_parents[meeting_id]
+        while node_id != -1:
+            path.append(node_id)
+            node_id = self._reverse_parents[node_id]
+        return path
+
+    def get_path(self, target_id):
+        # Path to target_id through the parents of the last query
+        path = [target_id]
+        parents = self._parents
+        node_id = parents[target_id]
+        while node_id != -1:
+            path.append(node_id)
+            node_id = parents[node_id]
+        path.reverse()
+        return path
+
+    def find_path(self, source, target, bidirectional=False):
+        # search with node objects. Mirrors nx.astar_path: returns a list of nodes, empty when unreachable.
+        source_id, target_id = self.compact_graph.get_id(source), self.compact_graph.get_id(target)
+        if source_id is None or target_id is None:
+            return []
+        if bidirectional:
+            path = self.search_bidirectional(source_id, target_id)
+        else:
+            path = self.search(source_id, target_id)
+        nodes = self.compact_graph.nodes
+        return [nodes[node_id] for node_id in path]
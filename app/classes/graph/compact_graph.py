@@ -0,0 +1,408 @@
+import numpy as np
+
+from heapq import heappush, heappop
+
+
+class CompactGraph:
+    # Integer-indexed mirror of the NetworkX graph in NavigationGraph.
+    # Nodes get int ids, coordinates live in float64 arrays and the adjacency is exposed as CSR arrays
+    # (indptr, indices, weights) that are rebuilt lazily after topology changes.
+    # Weight changes on existing edges are written into the CSR arrays in place.
+    initial_capacity = 64
+
+    def __init__(self):
+        self.nodes = []             # id -> node object, None for free slots
+        self.node_ids = dict()      # node object -> id
+        self._free_ids = []
+        self._successors = []       # id -> {successor id: weight}, None until built for a graph from a file
+        self._predecessors = []     # id -> set of predecessor ids
+        self.x = np.zeros(self.initial_capacity, dtype=np.float64)
+        self.y = np.zeros(self.initial_capacity, dtype=np.float64)
+        self.altitude = np.zeros(self.initial_capacity, dtype=np.float64)
+        self.blocked = np.zeros(self.initial_capacity, dtype=bool)     # Nodes with occupants
+        self.version = 0            # Bumped on any change to topology, weights or coordinates
+        self.bound_version = 0      # Bumped on changes that can shorten distances: new nodes or edges, lower weights
+        self.topology_version = 0   # Bumped when nodes or edges are added or removed
+        self.weights_hash = 0       # Follows every weight change, see get_weights_key
+        self._csr = None
+        self._csr_lists = None
+        self._reverse_csr = None
+        self._reverse_csr_lists = None
+        self._csr_keys = None       # Sorted row * size + column of every CSR entry, for bulk weight writes
+        self._reverse_csr_keys = None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        return node in self.node_ids
+
+    def get_id(self, node):
+        return self.node_ids.get(node)
+
+    def get_node(self, node_id):
+        return self.nodes[node_id]
+
+    def get_size(self):
+        # Number of id slots, i.e. the length of the per-node arrays that are in use
+        return len(self.nodes)
+
+    def _touch(self, topology=False, shorter=False):
+        self.version += 1
+        if shorter:
+            self.bound_version += 1
+        if topology:
+            self.topology_version += 1
+            self._csr = self._csr_lists = None
+            self._reverse_csr = self._reverse_csr_lists = None
+            self._csr_keys = self._reverse_csr_keys = None
+
+    def _ensure_capacity(self, size):
+        capacity = max(len(self.x), 1)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('x', 'y', 'altitude', 'blocked'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_node(self, node):
+        self._load_adjacency()
+        if node in self.node_ids:
+            return self.node_ids[node]
+        if self._free_ids:
+            node_id = self._free_ids.pop()
+            self.nodes[node_id] = node
+        else:
+            node_id = len(self.nodes)
+            self._ensure_capacity(node_id + 1)
+            self.nodes.append(node)
+            self._successors.append(dict())
+            self._predecessors.append(set())
+        self.node_ids[node] = node_id
+        self.x[node_id], self.y[node_id] = node.get_position()
+        self.altitude[node_id] = node.altitude
+        self.blocked[node_id] = node.has_occupants()
+        self._touch(topology=True, shorter=True)
+        return node_id
+
+    def remove_node(self, node):
+        self._load_adjacency()
+        node_id = self.node_ids.pop(node, None)
+        if node_id is None:
+            return False
+        for predecessor in self._predecessors[node_id]:
+            del self._successors[predecessor][node_id]
+        for successor in self._successors[node_id]:
+            self._predecessors[successor].discard(node_id)
+        self._successors[node_id] = dict()
+        self._predecessors[node_id] = set()
+        self.nodes[node_id] = None
+        self.x[node_id] = self.y[node_id] = self.altitude[node_id] = 0.0
+        self.blocked[node_id] = False
+        self._free_ids.append(node_id)
+        self._touch(topology=True)
+        return True
+
+    def set_node_position(self, node, position):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            return False
+        self.x[node_id], self.y[node_id] = position
+        self._touch()
+        return True
+
+    def set_node_altitude(self, node, altitude):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            return False
+        self.altitude[node_id] = altitude
+        self._touch()
+        return True
+
+    def set_node_blocked(self, node, blocked):
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            return False
+        self.blocked[node_id] = blocked
+        return True
+
+    def add_edge(self, from_node, to_node, weight):
+        self._load_adjacency()
+        u, v = self.node_ids.get(from_node), self.node_ids.get(to_node)
+        if u is None or v is None:
+            return False
+        successors = self._successors[u]
+        if v in successors:
+            return self.set_edge_weight(from_node, to_node, weight)
+        successors[v] = float(weight)
+        self._predecessors[v].add(u)
+        self._touch(topology=True, shorter=True)
+        return True
+
+    def remove_edge(self, from_node, to_node):
+        self._load_adjacency()
+        u, v = self.node_ids.get(from_node), self.node_ids.get(to_node)
+        if u is None or v is None or v not in self._successors[u]:
+            return False
+        del self._successors[u][v]
+        self._predecessors[v].discard(u)
+        self._touch(topology=True)
+        return True
+
+    def has_edge(self, from_node, to_node):
+        self._load_adjacency()
+        u, v = self.node_ids.get(from_node), self.node_ids.get(to_node)
+        return u is not None and v is not None and v in self._successors[u]
+
+    def get_edge_weight(self, from_node, to_node):
+        self._load_adjacency()
+        u, v = self.node_ids.get(from_node), self.node_ids.get(to_node)
+        if u is None or v is None:
+            return None
+        return self._successors[u].get(v)
+
+    def get_edge_weight_by_ids(self, u, v):
+        self._load_adjacency()
+        return self._successors[u].get(v)
+
+    def set_edge_weight(self, from_node, to_node, weight):
+        self._load_adjacency()
+        u, v = self.node_ids.get(from_node), self.node_ids.get(to_node)
+        if u is None or v is None or v not in self._successors[u]:
+            return False
+        weight = float(weight)
+        old_weight = self._successors[u][v]
+        if old_weight == weight:
+            return False
+        self.weights_hash ^= self._hash_edges([u, u], [v, v], [old_weight, weight])
+        self._successors[u][v] = weight
+        self._write_csr_weight(self._csr, self._csr_lists, u, v, weight)
+        self._write_csr_weight(self._reverse_csr, self._reverse_csr_lists, v, u, weight)
+        self._touch(shorter=weight < old_weight)
+        return True
+
+    @staticmethod
+    def _write_csr_weight(csr, csr_lists, row, column, weight):
+        if csr is None:
+            return
+        indptr, indices, weights = csr
+        start, end = indptr[row], indptr[row + 1]
+        position = start + int(np.searchsorted(indices[start:end], column))
+        weights[position] = weight
+        if csr_lists is not None:
+            csr_lists[2][position] = weight
+
+    def set_edge_weights(self, from_ids, to_ids, weights):
+        # Bulk set_edge_weight over id arrays of existing edges. The CSR arrays are written in one vectorized
+        # assignment each, the per-node adjacency and list copies only for the edges whose weight changed.
+        # Returns the mask of those edges.
+        from_ids = np.asarray(from_ids, dtype=np.int64)
+        to_ids = np.asarray(to_ids, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if self._csr is None:
+            # Topology changed since the CSR arrays were built, only the per-node adjacency holds weights
+            old_weights = np.array([self._successors[u][v] for u, v in zip(from_ids.tolist(), to_ids.tolist())],
+                                   dtype=np.float64)
+            changed = old_weights != weights
+            for u, v, weight in zip(from_ids[changed].tolist(), to_ids[changed].tolist(), weights[changed].tolist()):
+                self._successors[u][v] = weight
+            if changed.any():
+                self.weights_hash ^= self._hash_edges(from_ids[changed], to_ids[changed], old_weights[changed]) ^ \
+                    self._hash_edges(from_ids[changed], to_ids[changed], weights[changed])
+                self._touch(shorter=(weights < old_weights).any())
+            return changed
+        csr = self._csr
+        size = len(csr[0]) - 1
+        if self._csr_keys is None:
+            self._csr_keys = self._get_csr_keys(*csr)
+        positions = np.searchsorted(self._csr_keys, from_ids * size + to_ids)
+        old_weights = csr[2][positions]
+        changed = old_weights != weights
+        if not changed.any():
+            return changed
+        shorter = (weights < old_weights).any()
+        from_ids, to_ids, weights = from_ids[changed], to_ids[changed], weights[changed]
+        positions = positions[changed]
+        self.weights_hash ^= self._hash_edges(from_ids, to_ids, old_weights[changed]) ^ \
+            self._hash_edges(from_ids, to_ids, weights)
+        self._write_csr_weights(csr, self._csr_lists, positions, weights)
+        if self._reverse_csr is not None:
+            if self._reverse_csr_keys is None:
+                self._reverse_csr_keys = self._get_csr_keys(*self._reverse_csr)
+            reverse_positions = np.searchsorted(self._reverse_csr_keys, to_ids * size + from_ids)
+            self._write_csr_weights(self._reverse_csr, self._reverse_csr_lists, reverse_positions, weights)
+        if self._successors is not None:
+            for u, v, weight in zip(from_ids.tolist(), to_ids.tolist(), weights.tolist()):
+                self._successors[u][v] = weight
+        self._touch(shorter=shorter)
+        return changed
+
+    def get_weights_key(self):
+        # Equal keys mean equal edges and weights: the weights hash is only compared within one topology version
+        return self.topology_version, self.weights_hash
+
+    @staticmethod
+    def _hash_edges(from_ids, to_ids, weights):
+        # XOR of a 64 bit mix (splitmix64) of every (from id, to id, weight)
+        x = np.asarray(from_ids, dtype=np.uint64) << np.uint64(32)
+        x ^= np.asarray(to_ids, dtype=np.uint64)
+        x ^= np.asarray(weights, dtype=np.float64).view(np.uint64) * np.uint64(0x9e3779b97f4a7c15)
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xbf58476d1ce4e5b9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94d049bb133111eb)
+        x ^= x >> np.uint64(31)
+        return int(np.bitwise_xor.reduce(x)) if len(x) else 0
+
+    @staticmethod
+    def _get_csr_keys(indptr, indices, weights):
+        size = len(indptr) - 1
+        return np.repeat(np.arange(size, dtype=np.int64), np.diff(indptr)) * size + indices
+
+    @staticmethod
+    def _write_csr_weights(csr, csr_lists, positions, weights):
+        csr[2][positions] = weights
+        if csr_lists is not None:
+            list_weights = csr_lists[2]
+            for position, weight in zip(positions.tolist(), weights.tolist()):
+                list_weights[position] = weight
+
+    def _reset(self):
+        # Empties the graph. The versions keep counting up, so caches keyed on them never match the new content.
+        version, bound_version, topology_version = self.version, self.bound_version, self.topology_version
+        self.__init__()
+        self.version, self.bound_version, self.topology_version = version + 1, bound_version + 1, topology_version + 1
+
+    def clear(self):
+        self._reset()
+
+    def load_graph_file(self, graph_file, nodes=None):
+        # Replaces the content with a GraphFile. Coordinates and CSR arrays are the file's memmaps, the
+        # per-node adjacency is only built on the first edit or edge lookup, so searches over a loaded
+        # graph start without a pass over its edges. nodes are the objects of ids 0..n-1, by default the ids.
+        self._reset()
+        self.nodes = list(range(graph_file.get_node_count())) if nodes is None else list(nodes)
+        self.node_ids = {node: node_id for node_id, node in enumerate(self.nodes)}
+        self.x, self.y, self.altitude = graph_file.x, graph_file.y, graph_file.altitude
+        self.blocked = np.zeros(len(self.nodes), dtype=bool)
+        self._successors = self._predecessors = None
+        self._csr = graph_file.get_csr()
+
+    def _load_adjacency(self):
+        if self._successors is not None:
+            return
+        indptr, indices, weights = self.csr_lists()
+        self._successors = [dict(zip(indices[indptr[u]:indptr[u + 1]], weights[indptr[u]:indptr[u + 1]]))
+                            for u in range(len(self.nodes))]
+        self._predecessors = [set() for _ in self.nodes]
+        for u in range(len(self.nodes)):
+            for v in indices[indptr[u]:indptr[u + 1]]:
+                self._predecessors[v].add(u)
+
+    def csr(self):
+        # Returns (indptr, indices, weights) where the successors of id u are indices[indptr[u]:indptr[u+1]]
+        if self._csr is None:
+            def successor_weight(u, v):
+                return self._successors[u][v]
+            self._csr = self._build_csr(self._successors, successor_weight)
+            self._csr_lists = None
+        return self._csr
+
+    def reverse_csr(self):
+        # CSR of the reversed graph: the predecessors of id v are indices[indptr[v]:indptr[v+1]]
+        if self._reverse_csr is None and self._successors is None:
+            self._reverse_csr = self._transpose_csr(*self.csr())
+            self._reverse_csr_lists = None
+        if self._reverse_csr is None:
+            def predecessor_weight(v, u):
+                return self._successors[u][v]
+            self._reverse_csr = self._build_csr(self._predecessors, predecessor_weight)
+            self._reverse_csr_lists = None
+        return self._reverse_csr
+
+    @staticmethod
+    def _transpose_csr(indptr, indices, weights):
+        size = len(indptr) - 1
+        from_ids = np.repeat(np.arange(size, dtype=np.int64), np.diff(indptr))
+        order = np.lexsort((from_ids, indices))
+        reverse_indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=size), out=reverse_indptr[1:])
+        return reverse_indptr, from_ids[order], np.asarray(weights, dtype=np.float64)[order]
+
+    @staticmethod
+    def _build_csr(adjacency, get_weight):
+        indptr, indices, weights = [0], [], []
+        for row, columns in enumerate(adjacency):
+            for column in sorted(columns):
+                indices.append(column)
+                weights.append(get_weight(row, column))
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64), \
+            np.array(weights, dtype=np.float64)
+
+    def csr_lists(self):
+        # Plain-list copies of the CSR arrays. Indexing Python lists is cheaper than indexing
+        # NumPy arrays element by element, so the per-expansion loops of the searches use these.
+        if self._csr_lists is None:
+            indptr, indices, weights = self.csr()
+            self._csr_lists = indptr.tolist(), indices.tolist(), weights.tolist()
+        return self._csr_lists
+
+    def reverse_csr_lists(self):
+        if self._reverse_csr_lists is None:
+            indptr, indices, weights = self.reverse_csr()
+            self._reverse_csr_lists = indptr.tolist(), indices.tolist(), weights.tolist()
+        return self._reverse_csr_lists
+
+    def get_edge_ids(self):
+        # (from ids, to ids) of all edges, in CSR order
+        indptr, indices, weights = self.csr()
+        from_ids = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+        return from_ids, np.asarray(indices)
+
+    def get_edge_count(self):
+        return len(self.csr()[1])
+
+    def get_coordinates(self):
+        size = len(self.nodes)
+        return self.x[:size], self.y[:size]
+
+    def distances_to(self, node_id):
+        # Euclidean distance from every node slot to node_id, in one vectorized expression
+        xs, ys = self.get_coordinates()
+        return np.hypot(xs - self.x[node_id], ys - self.y[node_id])
+
+    def shortest_path_tree(self, source_id, reverse=False):
+        # Dijkstra from source_id over all reachable ids, skipping edges with infinite (blocked) cost.
+        # With reverse=True the tree is built over the reversed graph, i.e. distances are *to* source_id.
+        # Returns (distances, parents, settled ids in order), parents being -1 for the root and unreached ids.
+        infinity = float("inf")
+        indptr, indices, weights = self.reverse_csr_lists() if reverse else self.csr_lists()
+        size = len(self.nodes)
+        distances = [infinity] * size
+        parents = [-1] * size
+        settled = [False] * size
+        order = []
+        distances[source_id] = 0.0
+        queue = [(0.0, source_id)]
+        while queue:
+            dist, current = heappop(queue)
+            if settled[current]:
+                continue
+            settled[current] = True
+            order.append(current)
+            for i in range(indptr[current], indptr[current + 1]):
+                weight = weights[i]
+                if weight == infinity:
+                    continue
+                neighbor = indices[i]
+                ncost = dist + weight
+                if ncost < distances[neighbor]:
+                    distances[neighbor] = ncost
+                    parents[neighbor] = current
+                    heappush(queue, (ncost, neighbor))
+        return distances, parents, order
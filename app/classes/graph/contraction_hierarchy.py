@@ -0,0 +1,238 @@
+import numpy as np
+
+from heapq import heapify, heappush, heappop
+
+from app.classes.graph.compact_graph import CompactGraph
+from app.classes.graph.edge_cost_engine import EdgeCostEngine
+
+
+class ContractionHierarchy:
+    # Contraction hierarchy over the ids of a CompactGraph, for graphs whose topology stays fixed while only the
+    # occupancy changes, e.g. the grids of ConsoleView sweeps.
+    # Nodes are contracted from least to most important (edge difference plus contracted neighbors), adding a
+    # shortcut between two neighbors wherever a witness search finds no path as short as the one through the
+    # contracted node. A query is a bidirectional Dijkstra that only goes up in the contraction order.
+    # The hierarchy is built over the base weights, those of the edges with free target nodes. Blocking only
+    # raises weights, so base distances stay lower bounds, and a query path whose edges all still have their base
+    # weight is a shortest path. Otherwise search returns None and the caller falls back to e.g. A*.
+    # Topology changes, or weights below the base weights, make the hierarchy stale until build is called again.
+    # Paths cost the same as those of AStarEngine, but among paths of equal cost, e.g. on flat grids, the one
+    # returned depends on where the two searches meet and on the shortcuts kept, so it may differ from A*.
+    # Ties are broken by id, so the same hierarchy and query always give the same path.
+    witness_settle_limit = 60   # Nodes settled per witness search. Lower is faster, with more shortcuts.
+
+    def __init__(self, compact_graph, cost_engine=None):
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
+        self.cost_engine = cost_engine  # For the base weights of edges to blocked nodes, else those stay infinite
+        if False:
+            self.cost_engine = EdgeCostEngine(compact_graph)
+        self.rank = []
+        self.upward = []            # id -> [(higher ranked id, weight)] of the edges from id
+        self.downward = []          # id -> [(higher ranked id, weight)] of the edges to id
+        self.middles = dict()       # (u, w) -> the contracted id of the shortcut from u to w
+        self.base_weights = None    # In CSR order
+        self.base_successors = []   # id -> {successor id: base weight}
+        self.shortcut_count = 0
+        self.topology_version = None
+        self.bound_version = None
+
+    def is_valid(self):
+        graph = self.compact_graph
+        if self.topology_version != graph.topology_version:
+            return False
+        if self.bound_version != graph.bound_version:
+            # Some weights dropped, e.g. when nodes were unblocked. Still valid if none is below its base weight.
+            if (graph.csr()[2] < self.base_weights).any():
+                return False
+            self.bound_version = graph.bound_version
+        return True
+
+    def get_base_weights(self):
+        graph = self.compact_graph
+        from_ids, to_ids = graph.get_edge_ids()
+        weights = np.array(graph.csr()[2], dtype=np.float64)
+        blocked = graph.blocked[to_ids]
+        if self.cost_engine is not None and blocked.any():
+            weights[blocked] = self.cost_engine.calculate_costs(from_ids[blocked], to_ids[blocked],
+                                                                ignore_blocked=True)
+        return from_ids, to_ids, weights
+
+    def build(self):
+        graph = self.compact_graph
+        infinity = float("inf")
+        size = graph.get_size()
+        from_ids, to_ids, weights = self.get_base_weights()
+        self.base_weights = weights
+        self.base_successors = [dict() for _ in range(size)]
+        outgoing = [dict() for _ in range(size)]
+        incoming = [dict() for _ in range(size)]
+        for u, v, weight in zip(from_ids.tolist(), to_ids.tolist(), weights.tolist()):
+            self.base_successors[u][v] = weight
+            if weight != infinity:
+                outgoing[u][v] = weight
+                incoming[v][u] = weight
+
+        self.rank = [-1] * size
+        self.upward = [[] for _ in range(size)]
+        self.downward = [[] for _ in range(size)]
+        self.middles = dict()
+        self.shortcut_count = 0
+        contracted_neighbors = [0] * size
+
+        def get_priority(node_id):
+            # (priority, shortcuts needed to contract node_id now)
+            shortcuts = self._find_shortcuts(node_id, outgoing, incoming)
+            edge_difference = len(shortcuts) - len(outgoing[node_id]) - len(incoming[node_id])
+            return edge_difference + contracted_neighbors[node_id], shortcuts
+
+        queue = [(get_priority(node_id)[0], node_id) for node_id, node in enumerate(graph.nodes) if node is not None]
+        heapify(queue)
+        order = 0
+        while queue:
+            _, node_id = heappop(queue)
+            # Lazy update: contract only if the node is still the least important
+            priority, shortcuts = get_priority(node_id)
+            if queue and priority > queue[0][0]:
+                heappush(queue, (priority, node_id))
+                continue
+            self.rank[node_id] = order
+            order += 1
+            self.upward[node_id] = list(outgoing[node_id].items())
+            self.downward[node_id] = list(incoming[node_id].items())
+            for u in incoming[node_id]:
+                del outgoing[u][node_id]
+                contracted_neighbors[u] += 1
+            for w in outgoing[node_id]:
+                del incoming[w][node_id]
+                contracted_neighbors[w] += 1
+            outgoing[node_id] = dict()
+            incoming[node_id] = dict()
+            for u, w, weight in shortcuts:
+                if weight < outgoing[u].get(w, infinity):
+                    outgoing[u][w] = weight
+                    incoming[w][u] = weight
+                    self.middles[(u, w)] = node_id
+                    self.shortcut_count += 1
+        self.topology_version = graph.topology_version
+        self.bound_version = graph.bound_version
+
+    def _find_shortcuts(self, node_id, outgoing, incoming):
+        # (u, w, weight) of the shortcuts needed to contract node_id
+        infinity = float("inf")
+        shortcuts = []
+        successors = list(outgoing[node_id].items())
+        if not successors:
+            return shortcuts
+        max_out_weight = max(weight for w, weight in successors)
+        for u, in_weight in incoming[node_id].items():
+            distances = self._witness_search(u, node_id, in_weight + max_out_weight, outgoing)
+            for w, out_weight in successors:
+                if w != u and distances.get(w, infinity) > in_weight + out_weight:
+                    shortcuts.append((u, w, in_weight + out_weight))
+        return shortcuts
+
+    def _witness_search(self, source_id, excluded_id, max_cost, outgoing):
+        # Dijkstra from source_id around excluded_id, limited in cost and settled nodes. Every distance found is
+        # the length of a path, so a witness never drops a needed shortcut, it only may miss a shorter path.
+        infinity = float("inf")
+        distances = {source_id: 0.0}
+        queue = [(0.0, source_id)]
+        settled_count = 0
+        while queue and settled_count < self.witness_settle_limit:
+            dist, current = heappop(queue)
+            if dist > distances[current]:
+                continue
+            if dist > max_cost:
+                break
+            settled_count += 1
+            for neighbor, weight in outgoing[current].items():
+                if neighbor == excluded_id:
+                    continue
+                ncost = dist + weight
+                if ncost < distances.get(neighbor, infinity):
+                    distances[neighbor] = ncost
+                    heappush(queue, (ncost, neighbor))
+        return distances
+
+    def search(self, source_id, target_id):
+        # Returns the ids of a shortest path, or None when the hierarchy has no answer: it is stale, finds no
+        # path, or the path has edges whose weight changed, e.g. to blocked nodes
+        if not self.is_valid():
+            return None
+        if source_id == target_id:
+            return [source_id]
+        infinity = float("inf")
+        forward_distances, forward_parents = {source_id: 0.0}, {source_id: -1}
+        backward_distances, backward_parents = {target_id: 0.0}, {target_id: -1}
+        forward_queue, backward_queue = [(0.0, source_id)], [(0.0, target_id)]
+        best_cost = infinity
+        meeting_id = -1
+        while True:
+            forward_open = forward_queue and forward_queue[0][0] < best_cost
+            backward_open = backward_queue and backward_queue[0][0] < best_cost
+            if not forward_open and not backward_open:
+                break
+            if forward_open and (not backward_open or forward_queue[0][0] <= backward_queue[0][0]):
+                queue, edges, distances, parents = forward_queue, self.upward, forward_distances, forward_parents
+                other_distances = backward_distances
+            else:
+                queue, edges, distances, parents = backward_queue, self.downward, backward_distances, backward_parents
+                other_distances = forward_distances
+            dist, current = heappop(queue)
+            if dist > distances[current]:
+                continue
+            if current in other_distances and dist + other_distances[current] < best_cost:
+                best_cost = dist + other_distances[current]
+                meeting_id = current
+            for neighbor, weight in edges[current]:
+                ncost = dist + weight
+                if ncost < distances.get(neighbor, infinity):
+                    distances[neighbor] = ncost
+                    parents[neighbor] = current
+                    heappush(queue, (ncost, neighbor))
+        if meeting_id == -1:
+            return None
+        path = []
+        node_id = meeting_id
+        while node_id != -1:
+            path.append(node_id)
+            node_id = forward_parents[node_id]
+        path.reverse()
+        node_id = backward_parents[meeting_id]
+        while node_id != -1:
+            path.append(node_id)
+            node_id = backward_parents[node_id]
+        path = self.unpack(path)
+        get_weight = self.compact_graph.get_edge_weight_by_ids
+        for u, v in zip(path, path[1:]):
+            if get_weight(u, v) != self.base_successors[u][v]:
+                return None
+        return path
+
+    def unpack(self, path):
+        # Replaces the shortcuts in a path of ids by the edges they stand for
+        unpacked = [path[0]]
+        for u, w in zip(path, path[1:]):
+            stack = [(u, w)]
+            while stack:
+                a, b = stack.pop()
+                middle = self.middles.get((a, b))
+                if middle is None:
+                    unpacked.append(b)
+                else:
+                    stack.append((middle, b))
+                    stack.append((a, middle))
+        return unpacked
+
+    def find_path(self, source, target):
+        # search with node objects, None when the hierarchy has no answer
+        source_id, target_id = self.compact_graph.get_id(source), self.compact_graph.get_id(target)
+        if source_id is None or target_id is None:
+            return None
+        path = self.search(source_id, target_id)
+        if path is None:
+            return None
+        nodes = self.compact_graph.nodes
+        return [nodes[node_id] for node_id in path]
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from heapq import heappush, heappop
+from itertools import count
+
+from app.config import config
+from app.classes.graph.path import Path
+from app.classes.graph.pathfinder import Pathfinder
+
+
+class DStarLiteSearch:
+    # Search state of D* Lite (Koenig & Likhachev, 2002) towards one fixed goal.
+    # The search runs backwards from the goal, so g(s) is the cost from s to the goal. When edge costs
+    # change only the affected vertices are re-expanded, and a moving start is absorbed by the key
+    # modifier km instead of rebuilding the queue.
+    def __init__(self, graph, goal, heuristic):
+        self.graph = graph
+        self.goal = goal
+        self.heuristic = heuristic
+        self.infinity = float("inf")
+        self.g = dict()
+        self.rhs = {goal: 0}
+        self.km = 0
+        self.last_start = None
+        self.open = dict()  # node -> current key, stale heap entries are skipped when popped
+        self.queue = []
+        self.counter = count()
+        self.changed_nodes = set()
+        self.expansions = 0
+        self._push(goal, (0, 0))
+
+    def get_g(self, node):
+        return self.g.get(node, self.infinity)
+
+    def get_rhs(self, node):
+        return self.rhs.get(node, self.infinity)
+
+    def _push(self, node, key):
+        self.open[node] = key
+        heappush(self.queue, (key[0], key[1], next(self.counter), node))
+
+    def _top(self):
+        while self.queue:
+            k1, k2, _, node = self.queue[0]
+            if self.open.get(node) == (k1, k2):
+                return node, (k1, k2)
+            heappop(self.queue)
+        return None, (self.infinity, self.infinity)
+
+    def calculate_key(self, node, start):
+        value = min(self.get_g(node), self.get_rhs(node))
+        return value + self.heuristic(start, node) + self.km, value
+
+    def notify_edge_change(self, from_node, to_node):
+        # The cost of (from_node, to_node) changed, so rhs(from_node) must be re-evaluated
+        self.changed_nodes.add(from_node)
+
+    def update_vertex(self, node, start):
+        if node is not self.goal:
+            best = self.infinity
+            if node in self.graph:
+                for successor, data in self.graph[node].items():
+                    cost = data.get(config.strings.weight, 1) + self.get_g(successor)
+                    if cost < best:
+                        best = cost
+            self.rhs[node] = best
+        self.open.pop(node, None)
+        if self.get_g(node) != self.get_rhs(node) and node in self.graph:
+            self._push(node, self.calculate_key(node, start))
+
+    def compute_shortest_path(self, start):
+        if self.last_start is None:
+            self.last_start = start
+        elif start is not self.last_start:
+            self.km += self.heuristic(self.last_start, start)
+            self.last_start = start
+        for node in self.changed_nodes:
+            self.update_vertex(node, start)
+        self.changed_nodes.clear()
+
+        while True:
+            node, k_old = self._top()
+            if node is None:
+                break
+            if k_old >= self.calculate_key(start, start) and self.get_rhs(start) == self.get_g(start):
+                break
+            heappop(self.queue)
+            del self.open[node]
+            if node not in self.graph:
+                continue
+            self.expansions += 1
+            k_new = self.calculate_key(node, start)
+            if k_old < k_new:
+                self._push(node, k_new)
+            elif self.get_g(node) > self.get_rhs(node):
+                self.g[node] = self.get_rhs(node)
+                for predecessor in self.graph.pred[node]:
+                    self.update_vertex(predecessor, start)
+            else:
+                self.g[node] = self.infinity
+                for predecessor in list(self.graph.pred[node]) + [node]:
+                    self.update_vertex(predecessor, start)
+
+    def extract_path(self, start):
+        if self.get_g(start) == self.infinity:
+            return []
+        nodes = [start]
+        visited = {start}
+        node = start
+        while node is not self.goal:
+            next_node = None
+            best = self.infinity
+            for successor, data in self.graph[node].items():
+                cost = data.get(config.strings.weight, 1) + self.get_g(successor)
+                if cost < best:
+                    best = cost
+                    next_node = successor
+            if next_node is None or next_node in visited:
+                return []
+            nodes.append(next_node)
+            visited.add(next_node)
+            node = next_node
+        return nodes
+
+
+class DStarLitePathfinder(Pathfinder):
+    # Incremental replanning: keeps one D* Lite search per destination between queries, and repairs
+    # it when NavigationGraph reports changed edge costs (e.g. a node is blocked or unblocked) or when
+    # the start node moves along the path. Waypoint segments each get their own search.
+    max_searches = 8
+
+    def __init__(self, graph, altitude_function=None, compact_graph=None):
+        Pathfinder.__init__(self, graph, altitude_function, compact_graph)
+        self.searches = OrderedDict()   # destination node -> DStarLiteSearch, least recently used first
+
+        def heuristics(from_node, to_node):
+            return from_node.get_distance_to(to_node)
+        self.heuristic_function = heuristics
+
+    def get_search(self, destination):
+        search = self.searches.get(destination)
+        if search is None:
+            search = DStarLiteSearch(self.graph, destination, self.heuristic_function)
+            self.searches[destination] = search
+            while len(self.searches) > self.max_searches:
+                self.searches.popitem(last=False)
+        else:
+            self.searches.move_to_end(destination)
+        return search
+
+    def reset_searches(self):
+        self.searches.clear()
+
+    def notify_edge_change(self, from_node, to_node):
+        for search in self.searches.values():
+            search.notify_edge_change(from_node, to_node)
+
+    def notify_graph_change(self):
+        # Node positions changed, which invalidates the heuristic values used in the stored keys
+        self.reset_searches()
+
+    def clear_node(self, node, ignore_refresh=False):
+        self.searches.pop(node, None)
+        super().clear_node(node, ignore_refresh)
+
+    def create_path(self):
+        start, destination = self.start_node, self.destination_node
+        if not start or not destination or start not in self.graph or destination not in self.graph:
+            return Path([])
+        if start is destination:
+            return Path([start])
+        search = self.get_search(destination)
+        search.compute_shortest_path(start)
+        return Path(search.extract_path(start))
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 from app.config import config
 from app.pythomas import pythomas as lib
 from app.pythomas import shapes as shapelib
@@ -19,6 +21,8 @@ class Edge:
         self.color = config.world.edge_triangle_color
         self.is_path_edge = False
         self._drawing_triangles = False
+        self._visible = True        # False while culled from the view
+        self._show_arrows = True    # False when zoomed out too far to see the triangles
 
         if not skip_update:
             #   NB! Must be started AFTER all attributes are set:
@@ -35,6 +39,11 @@ class Edge:
         return None
 
     def draw(self, batch=None):
+        if self.line_rectangle is None:
+            # Edges created with skip_update, e.g. by a graph without visuals, get their shapes on first draw
+            self.update_shape()
+            if self.line_rectangle is None:
+                return
         if self.line_rectangle.color != self.color:
             self.line_rectangle.set_color(self.color)
         self.line_rectangle.draw(batch)
@@ -82,8 +91,6 @@ class Edge:
                                                   line_point=to_position,
                                                   direction_point=from_position)
 
-        point_difference = lib.subtract_points(to_circle_point, from_circle_point)
-        line_distance = lib.get_point_distance(from_circle_point, to_circle_point)
         self.update_circles(from_circle_point, to_circle_point)
 
         colors = list(config.world.edge_color * 4)
@@ -97,27 +104,8 @@ class Edge:
                 self.line_rectangle.delete()
             self.line_rectangle = shapelib.Rectangle(from_circle_point, to_circle_point,
                                                      config.world.edge_thickness, colors_list=colors, z=self.z-1)
-
-            def add_triangles():
-                def delete_old_triangles():
-                    for old_triangle in self.line_triangles:
-                        old_triangle.delete()
-                    self.line_triangles.clear()
-                delete_old_triangles()
-                triangle_color = self.color
-                triangle_base_width = config.world.edge_triangles_width
-                triangle_height = 0.866 * triangle_base_width  # sqrt(3)/2
-                triangle_count = int(line_distance / triangle_height)
-                pdx, pdy = point_difference
-                steps = (0, 0) if triangle_count < 1 else (pdx/triangle_count, pdy/triangle_count)
-                for i in range(triangle_count):
-                    position = lib.sum_points(from_circle_point, lib.multiply_points(steps, (i, i)))
-                    triangle = shapelib.Triangle.create_with_centroid(centroid=position, base_width=triangle_base_width,
-                                                                      height=triangle_height, rotation=theta,
-                                                                      color=triangle_color, z=self.z)
-                    self.line_triangles.append(triangle)
             if self._drawing_triangles:
-                add_triangles()
+                self.update_triangles(from_circle_point, to_circle_point, theta)
             inner_color = config.world.edge_in_node_color
             inner_line_width = 4
             if self.inner_from_shape:
@@ -128,6 +116,99 @@ class Edge:
                                                        radius=inner_line_width, color=inner_color, z=from_node.z+1)
             self.inner_to_shape = shapelib.Rectangle(to_node.get_position(), self.to_circle.get_position(),
                                                      radius=inner_line_width,  color=inner_color, z=to_node.z+1)
+        self.apply_visibility()
+
+    def update_triangles(self, from_circle_point, to_circle_point, theta):
+        # Existing triangles are moved, only the difference in count is created or deleted
+        triangle_color = self.color
+        triangle_base_width = config.world.edge_triangles_width
+        triangle_height = 0.866 * triangle_base_width  # sqrt(3)/2
+        line_distance = lib.get_point_distance(from_circle_point, to_circle_point)
+        triangle_count = int(line_distance / triangle_height)
+        pdx, pdy = lib.subtract_points(to_circle_point, from_circle_point)
+        steps = (0, 0) if triangle_count < 1 else (pdx/triangle_count, pdy/triangle_count)
+        for old_triangle in self.line_triangles[triangle_count:]:
+            old_triangle.delete()
+        del self.line_triangles[triangle_count:]
+        for i in range(triangle_count):
+            position = lib.sum_points(from_circle_point, lib.multiply_points(steps, (i, i)))
+            if i < len(self.line_triangles):
+                self.line_triangles[i].set_centroid(position, rotation=theta)
+                continue
+            triangle = shapelib.Triangle.create_with_centroid(centroid=position, base_width=triangle_base_width,
+                                                              height=triangle_height, rotation=theta,
+                                                              color=triangle_color, z=self.z)
+            self.line_triangles.append(triangle)
+
+    def set_end_points(self, from_circle_point, to_circle_point, theta, line_corners=None):
+        # Same result as update_shape for end points computed elsewhere, but moves the existing shapes
+        # instead of deleting and re-adding them to the batch.
+        if self.line_rectangle is None or self.inner_from_shape is None or self.inner_to_shape is None:
+            self.update_shape()
+            return
+        self.update_circles(from_circle_point, to_circle_point)
+        self.line_rectangle.set_end_points(from_circle_point, to_circle_point, corners=line_corners)
+        if self._drawing_triangles:
+            self.update_triangles(from_circle_point, to_circle_point, theta)
+        self.inner_from_shape.set_end_points(self.from_node.get_position(), from_circle_point)
+        self.inner_to_shape.set_end_points(self.to_node.get_position(), to_circle_point)
+        self.apply_visibility()
+
+    @staticmethod
+    def update_shapes(edges):
+        # Vectorized update_shape for many edges, e.g. all edges marked dirty since the last frame.
+        # Edges without shapes yet, or whose end points can not be found, fall back to update_shape.
+        edges = list(edges)
+        if not edges:
+            return
+        from_positions = np.array([edge.from_node.get_position() for edge in edges], dtype=np.float64)
+        to_positions = np.array([edge.to_node.get_position() for edge in edges], dtype=np.float64)
+        difference = to_positions - from_positions
+        thetas = np.arctan2(difference[:, 1], difference[:, 0])
+        offset_directions = np.column_stack([np.sin(thetas), -np.cos(thetas)])
+
+        def get_lane_offsets(nodes):
+            lane_offset = config.world.edge_lane_offset
+            if not config.world.adjust_edge_to_selection:
+                return np.full(len(nodes), lane_offset, dtype=np.float64)
+            return np.array([lane_offset + (config.world.selected_radius_decrease if node.is_selected() else 0)
+                             for node in nodes], dtype=np.float64)
+
+        from_line_points = from_positions + offset_directions * get_lane_offsets([e.from_node for e in edges])[:, None]
+        to_line_points = to_positions + offset_directions * get_lane_offsets([e.to_node for e in edges])[:, None]
+        radius_offset = 3
+        from_radii = np.array([edge.from_node.get_visual_radius() for edge in edges], dtype=np.float64) + radius_offset
+        to_radii = np.array([edge.to_node.get_visual_radius() for edge in edges], dtype=np.float64) + radius_offset
+
+        from_circle_points = lib.get_points_on_circles(from_positions, from_radii, from_line_points, to_line_points)
+        to_circle_points = lib.get_points_on_circles(to_positions, to_radii, to_line_points, from_line_points)
+        line_corners = lib.get_rectangle_corners(from_circle_points, to_circle_points, config.world.edge_thickness)
+        valid = np.isfinite(from_circle_points).all(axis=1) & np.isfinite(to_circle_points).all(axis=1)
+
+        for i, edge in enumerate(edges):
+            if not valid[i]:
+                edge.update_shape()
+                continue
+            edge.set_end_points(tuple(from_circle_points[i].tolist()), tuple(to_circle_points[i].tolist()),
+                                float(thetas[i]), line_corners=line_corners[i])
+
+    def set_visible(self, visible, show_arrows=True):
+        self._visible = visible
+        self._show_arrows = show_arrows
+        self.apply_visibility()
+
+    def apply_visibility(self):
+        # Also called after shapes are created, so new shapes of a culled edge stay out of the batch
+        for shape in (self.line_rectangle, self.from_circle, self.to_circle):
+            if shape:
+                shape.set_visible(self._visible)
+        for triangle in self.line_triangles:
+            triangle.set_visible(self._visible and self._show_arrows)
+
+    def update_tessellation(self):
+        for circle in (self.from_circle, self.to_circle):
+            if circle:
+                circle.update_tessellation()
 
     def set_color(self, color):
         self.color = color
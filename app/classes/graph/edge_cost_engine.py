@@ -0,0 +1,62 @@
+import numpy as np
+
+from app.config import config
+from app.classes.graph.compact_graph import CompactGraph
+
+
+class EdgeCostEngine:
+    # Edge cost model of the pathfinders, computed for arrays of edge ids from the coordinate, altitude and
+    # blocked arrays of a CompactGraph. Recomputing the weights of all edges, e.g. after changing a coefficient
+    # or the heightmap, is one array expression. Altitude raises are the altitude differences of the end nodes,
+    # as in NavigationGraph.altitude_function.
+    max_slope = 2   # 60 degrees
+    min_slope = -2  # -60 degrees
+    altitude_wgt_coefficient = 1
+    distance_coefficient = 1
+
+    def __init__(self, compact_graph, use_altitude=True):
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
+        self.use_altitude = use_altitude
+
+    def get_slope_width(self):
+        return abs(self.max_slope - self.min_slope)
+
+    def calculate_cost(self, distance, alt_raise, blocked=False):
+        # The cost of a single edge, the scalar form of calculate_costs
+        if blocked:
+            return config.world.blocked_node_edge_cost
+        slope = alt_raise/distance if distance else 0
+        alt_contribution = float("inf")  # Float representation of infinity
+        if self.min_slope < slope < self.max_slope:
+            alt_contribution = slope - self.min_slope
+        alt_cost = alt_contribution / self.get_slope_width() * distance
+        return distance * self.distance_coefficient + self.altitude_wgt_coefficient * alt_cost
+
+    def calculate_costs(self, from_ids, to_ids, ignore_blocked=False):
+        # With ignore_blocked, the costs the edges have when their target nodes are free
+        graph = self.compact_graph
+        from_ids = np.asarray(from_ids, dtype=np.int64)
+        to_ids = np.asarray(to_ids, dtype=np.int64)
+        dx = np.abs(graph.x[from_ids] - graph.x[to_ids])
+        dy = np.abs(graph.y[from_ids] - graph.y[to_ids])
+        distances = np.sqrt(dx*dx + dy*dy)
+        if self.use_altitude:
+            alt_raises = graph.altitude[to_ids] - graph.altitude[from_ids]
+        else:
+            alt_raises = np.zeros(len(distances))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.where(distances != 0, alt_raises / distances, 0.0)
+        alt_contributions = np.where((self.min_slope < slopes) & (slopes < self.max_slope),
+                                     slopes - self.min_slope, float("inf"))
+        alt_costs = alt_contributions / self.get_slope_width() * distances
+        costs = distances * self.distance_coefficient + self.altitude_wgt_coefficient * alt_costs
+        if not ignore_blocked:
+            costs[graph.blocked[to_ids]] = config.world.blocked_node_edge_cost
+        return costs
+
+    def calculate_all_costs(self):
+        # (from ids, to ids, costs) of all edges, in CSR order
+        from_ids, to_ids = self.compact_graph.get_edge_ids()
+        return from_ids, to_ids, self.calculate_costs(from_ids, to_ids)
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class GraphFile:
+    # Binary graph file: a fixed header followed by the node coordinate arrays and the CSR adjacency
+    # (indptr, indices, weights), each array starting at a 64 byte boundary.
+    # The arrays are opened with numpy.memmap, so loading takes no time and worker processes that open the
+    # same file share its pages. The default mode 'c' is copy-on-write: writes, e.g. of edge weights,
+    # stay private to the process and never reach the file.
+    magic = b'PRETREAT'
+    version = 1
+    alignment = 64
+    header_dtype = np.dtype([('magic', 'S8'), ('version', '<u4'), ('padding', '<u4'),
+                             ('n_nodes', '<i8'), ('n_edges', '<i8'), ('start', '<i8'), ('destination', '<i8')])
+
+    def __init__(self, filename, mode='c'):
+        self.filename = filename
+        header = np.fromfile(filename, dtype=self.header_dtype, count=1)
+        if len(header) != 1 or header['magic'][0] != self.magic:
+            raise ValueError("{} is not a graph file".format(filename))
+        if header['version'][0] != self.version:
+            raise ValueError("{} has version {}, expected {}".format(filename, header['version'][0], self.version))
+        self.n_nodes = int(header['n_nodes'][0])
+        self.n_edges = int(header['n_edges'][0])
+        start, destination = int(header['start'][0]), int(header['destination'][0])
+        self.start = start if start >= 0 else None
+        self.destination = destination if destination >= 0 else None
+        for name, dtype, length, offset in self.get_layout(self.n_nodes, self.n_edges):
+            if length:
+                array = np.memmap(filename, dtype=dtype, mode=mode, offset=offset, shape=(length,))
+            else:
+                array = np.zeros(0, dtype=dtype)    # memmap can not map empty arrays
+            setattr(self, name, array)
+
+    @classmethod
+    def get_layout(cls, n_nodes, n_edges):
+        # (name, dtype, length, offset) of every array in file order
+        arrays = [('x', '<f8', n_nodes), ('y', '<f8', n_nodes), ('altitude', '<f8', n_nodes),
+                  ('indptr', '<i8', n_nodes + 1), ('indices', '<i8', n_edges), ('weights', '<f8', n_edges)]
+        layout = []
+        offset = cls.header_dtype.itemsize
+        for name, dtype, length in arrays:
+            offset = -(-offset // cls.alignment) * cls.alignment
+            layout.append((name, dtype, length, offset))
+            offset += np.dtype(dtype).itemsize * length
+        return layout
+
+    def get_node_count(self):
+        return self.n_nodes
+
+    def get_edge_count(self):
+        return self.n_edges
+
+    def get_csr(self):
+        return self.indptr, self.indices, self.weights
+
+    def get_edges(self):
+        # (from ids, to ids, weights) of all edges, in CSR order
+        from_ids = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr))
+        return from_ids, np.asarray(self.indices), np.asarray(self.weights)
+
+    @staticmethod
+    def build_csr(n_nodes, from_ids, to_ids, weights):
+        # CSR arrays of the edges, with the successors of every node sorted by id
+        from_ids = np.asarray(from_ids, dtype=np.int64)
+        to_ids = np.asarray(to_ids, dtype=np.int64)
+        order = np.lexsort((to_ids, from_ids))
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(from_ids, minlength=n_nodes), out=indptr[1:])
+        return indptr, to_ids[order], np.asarray(weights, dtype=np.float64)[order]
+
+    @classmethod
+    def write(cls, filename, x, y, altitude, indptr, indices, weights, start=None, destination=None):
+        n_nodes, n_edges = len(x), len(indices)
+        header = np.zeros(1, dtype=cls.header_dtype)
+        header['magic'] = cls.magic
+        header['version'] = cls.version
+        header['n_nodes'] = n_nodes
+        header['n_edges'] = n_edges
+        header['start'] = -1 if start is None else start
+        header['destination'] = -1 if destination is None else destination
+        arrays = {'x': x, 'y': y, 'altitude': altitude, 'indptr': indptr, 'indices': indices, 'weights': weights}
+        with open(filename, 'wb') as f:
+            f.write(header.tobytes())
+            for name, dtype, length, offset in cls.get_layout(n_nodes, n_edges):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+    @classmethod
+    def write_edges(cls, filename, x, y, altitude, from_ids, to_ids, weights, start=None, destination=None):
+        indptr, indices, weights = cls.build_csr(len(x), from_ids, to_ids, weights)
+        cls.write(filename, x, y, altitude, indptr, indices, weights, start, destination)
@@ -0,0 +1,92 @@
+import numpy as np
+
+from app.config import config
+from app.classes.graph.compact_graph import CompactGraph
+
+
+class Landmarks:
+    # ALT (A*, Landmarks, Triangle inequality) heuristic over a CompactGraph. For every landmark L the tables hold
+    # the distances from L to all ids and from all ids to L, and by the triangle inequality
+    #   d(v, t) >= d(L, t) - d(L, v)   and   d(v, t) >= d(v, L) - d(t, L)
+    # The bound is the largest of these and the Euclidean distance. Blocked edges are left out of the distances,
+    # and terms with an unreachable end are left out of the bounds.
+    # Changes that can shorten distances (see CompactGraph.bound_version) invalidate the tables, which are then
+    # built again on next use. Higher weights, e.g. of edges to blocked nodes, keep the bounds admissible.
+    def __init__(self, compact_graph, landmark_count=None):
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
+        self.landmark_count = config.world.landmark_count if landmark_count is None else landmark_count
+        self.landmark_ids = []
+        self.from_landmarks = None  # Array of landmark x id distances from the landmarks
+        self.to_landmarks = None    # Array of landmark x id distances to the landmarks
+        self.bound_version = None   # CompactGraph.bound_version of the tables
+
+    def is_valid(self):
+        return self.bound_version == self.compact_graph.bound_version
+
+    def invalidate(self):
+        self.bound_version = None
+
+    def update(self):
+        # Picks the landmarks and builds their tables. The first landmark is the node farthest from the center
+        # of the graph, each next one the node with the longest round trip to its closest landmark so far.
+        graph = self.compact_graph
+        size = graph.get_size()
+        ids = np.array([node_id for node_id, node in enumerate(graph.nodes) if node is not None], dtype=np.int64)
+        landmark_ids, from_rows, to_rows = [], [], []
+        if len(ids) and self.landmark_count > 0:
+            xs, ys = graph.get_coordinates()
+            center_distances = np.hypot(xs[ids] - xs[ids].mean(), ys[ids] - ys[ids].mean())
+            landmark_id = int(ids[np.argmax(center_distances)])
+            round_trips = np.full(size, float("inf"))
+            while True:
+                landmark_ids.append(landmark_id)
+                from_rows.append(graph.shortest_path_tree(landmark_id)[0])
+                to_rows.append(graph.shortest_path_tree(landmark_id, reverse=True)[0])
+                if len(landmark_ids) >= min(self.landmark_count, len(ids)):
+                    break
+                round_trips = np.minimum(round_trips, np.array(from_rows[-1]) + np.array(to_rows[-1]))
+                # Unreachable ids only become landmarks once no reachable one is left
+                candidates = np.where(np.isfinite(round_trips[ids]), round_trips[ids], -1.0)
+                candidates[np.isin(ids, landmark_ids)] = -2.0
+                landmark_id = int(ids[np.argmax(candidates)])
+        self.landmark_ids = landmark_ids
+        self.from_landmarks = np.array(from_rows, dtype=np.float64).reshape(len(landmark_ids), size)
+        self.to_landmarks = np.array(to_rows, dtype=np.float64).reshape(len(landmark_ids), size)
+        self.bound_version = graph.bound_version
+
+    def get_lower_bounds(self, node_id, reverse=False):
+        # Lower bounds of the distances from every id to node_id, or with reverse=True from node_id to every id
+        if not self.is_valid():
+            self.update()
+        bounds = self.compact_graph.distances_to(node_id)
+        if not self.landmark_ids:
+            return bounds
+        from_landmarks, to_landmarks = self.from_landmarks, self.to_landmarks
+        with np.errstate(invalid='ignore'):
+            if reverse:
+                terms = np.concatenate((from_landmarks - from_landmarks[:, [node_id]],
+                                        to_landmarks[:, [node_id]] - to_landmarks))
+            else:
+                terms = np.concatenate((from_landmarks[:, [node_id]] - from_landmarks,
+                                        to_landmarks - to_landmarks[:, [node_id]]))
+        terms[~np.isfinite(terms)] = 0.0
+        return np.maximum(bounds, terms.max(axis=0))
+
+    def heuristic(self, from_node, to_node):
+        # Scalar bound between node objects, e.g. for AStarPathfinder.heuristic_function
+        distance = from_node.get_distance_to(to_node)
+        u, t = self.compact_graph.get_id(from_node), self.compact_graph.get_id(to_node)
+        if u is None or t is None:
+            return distance
+        if not self.is_valid():
+            self.update()
+        if not self.landmark_ids:
+            return distance
+        from_landmarks, to_landmarks = self.from_landmarks, self.to_landmarks
+        with np.errstate(invalid='ignore'):
+            terms = np.concatenate((from_landmarks[:, t] - from_landmarks[:, u],
+                                    to_landmarks[:, u] - to_landmarks[:, t]))
+        terms = terms[np.isfinite(terms)]
+        return max(distance, float(terms.max())) if len(terms) else distance
@@ -3,12 +3,19 @@ import pyglet
 
 from heapq import heappush, heappop
 import networkx as nx
+import numpy as np
 
 from app.config import config, seeded_random as random
-from app.pythomas import pythomas as lib
+from app.pythomas import pythomas as lib, shapes as shapelib
+from app.classes.heightmap import Heightmap
 from app.classes.graph.node import Node
 from app.classes.graph.edge import Edge
+from app.classes.graph.compact_graph import CompactGraph
+from app.classes.graph.graph_file import GraphFile
+from app.classes.graph.landmarks import Landmarks
+from app.classes.graph.spatial_index import SpatialIndex
 from app.classes.graph.pathfinder import AStarPathfinder, CustomPathfinder
+from app.classes.graph.dstar_lite_pathfinder import DStarLitePathfinder
 from app.classes.graph.agency import Agency
 from app.classes.graph.pretreat_pathfinder import PretreatPathfinder
 
@@ -16,34 +23,103 @@ from app.classes.graph.pretreat_pathfinder import PretreatPathfinder
 class NavigationGraph():
     def __init__(self):
         self.graph = nx.DiGraph()
+        self.compact_graph = CompactGraph()
+        self.spatial_index = SpatialIndex(cell_size=2 * self.get_max_node_radius())
         self._no_visuals = False
         # self.selected_nodes = []
-        self.altitude_image = pyglet.resource.image(lib.resource(config.strings.altitude_map))
-        self.pathfinder = AStarPathfinder(self.graph, self.altitude_function)
+        self._altitude_image = None
+        self.heightmap = None   # Decoded from altitude_image on first use
+        self.pathfinder = AStarPathfinder(self.graph, self.altitude_function, self.compact_graph)
         self.pathfinder.push_handlers(self)
+        self.landmarks = None   # ALT heuristic of the pathfinders, see build_landmarks
+        if False:
+            self.landmarks = Landmarks(self.compact_graph)
         self.node_positions_dirty = False   # Node positions
         self.node_set_dirty = False         # Adding/Removing nodes
         self.node_selected_dirty = False    # Selected/deselected nodes
-        self.render_batch = pyglet.graphics.Batch()
+        self._render_batch = None
         self.edge_update_timer = 0
         self.agency = Agency(self)
-        self.update_edge_on_next = []
+        self.dirty_edges = set()    # Edge tuples whose shapes are rebuilt together on the next edge refresh
+        # Culling: with a view rectangle, only nodes and edges within it are drawn. None draws everything.
+        self.view_rect = None
+        self.view_zoom = 1.0
+        self.view_dirty = False
+        self.tessellation_dirty = False
+        self.visible_nodes = None   # Sets once culling started, None while everything is visible
+        self.visible_edges = None
+        self.max_edge_length = 0.0  # Longest edge added or moved since clear, how far outside the view edges reach
+        self.show_labels = True
+        self.show_arrows = True
+
+    # The image and batch are loaded on first use, so a graph without visuals never needs a display
+    @property
+    def altitude_image(self):
+        if self._altitude_image is None:
+            self._altitude_image = pyglet.resource.image(lib.resource(config.strings.altitude_map))
+        return self._altitude_image
+
+    @property
+    def render_batch(self):
+        if self._render_batch is None:
+            self._render_batch = pyglet.graphics.Batch()
+        return self._render_batch
 
     def set_no_visuals(self, no_visuals=False):
         self._no_visuals = no_visuals
 
+    def set_pathfinder(self, pathfinder):
+        # Replace the pathfinder, e.g. with a DStarLitePathfinder, and keep the current path ends and waypoints
+        old_pathfinder = self.pathfinder
+        old_pathfinder.remove_handlers(self)
+        pathfinder.start_node = old_pathfinder.start_node
+        pathfinder.destination_node = old_pathfinder.destination_node
+        pathfinder.waypoints = old_pathfinder.waypoints
+        pathfinder.cost_engine = old_pathfinder.cost_engine
+        if self.landmarks is not None:
+            pathfinder.set_landmarks(self.landmarks)
+        pathfinder.push_handlers(self)
+        self.pathfinder = pathfinder
+        self.pathfinder.refresh_path()
+
+    def build_landmarks(self, landmark_count=None):
+        # ALT preprocessing: picks the landmarks and builds their distance tables, which the pathfinder uses as a
+        # tighter heuristic from here on. The tables are rebuilt on next use after changes that shorten distances.
+        self.landmarks = Landmarks(self.compact_graph, landmark_count)
+        self.landmarks.update()
+        self.pathfinder.set_landmarks(self.landmarks)
+        return self.landmarks
+
+    def get_heightmap(self):
+        if self.heightmap is None:
+            self.heightmap = Heightmap(self.altitude_image, config.world.min_altitude, config.world.max_altitude,
+                                       bilinear=config.world.interpolate_altitude)
+        return self.heightmap
+
     def get_altitude(self, position):
-        min_altitude = config.world.min_altitude
-        max_altitude = config.world.max_altitude
-        # pixel_value = 1 - lib.get_pixel(self.altitude_image, position)[0]/255
-        # altitude = (max_altitude - min_altitude) * pixel_value + min_altitude
-        # return altitude
-        return min_altitude
+        if not config.world.use_altitude_map:
+            return config.world.min_altitude
+        return self.get_heightmap().get_altitude(position)
+
+    def get_altitudes(self, xs, ys):
+        if not config.world.use_altitude_map:
+            return np.full(len(xs), config.world.min_altitude, dtype=np.float64)
+        return self.get_heightmap().sample(xs, ys)
+
+    def update_altitudes(self):
+        # Samples the altitudes of all nodes again, e.g. after the heightmap changed, and re-weights all edges
+        compact_graph = self.compact_graph
+        xs, ys = compact_graph.get_coordinates()
+        altitudes = self.get_altitudes(xs, ys)
+        compact_graph.altitude[:len(altitudes)] = altitudes
+        for node, altitude in zip(compact_graph.nodes, altitudes.tolist()):
+            if node is not None:
+                node.altitude = altitude
+        return self.update_edge_weights()
 
     def altitude_function(self, from_node, to_node):
-        to_alt = self.get_altitude(to_node.get_position())
-        from_alt = self.get_altitude(from_node.get_position())
-        return to_alt - from_alt
+        # Node altitudes are sampled from the heightmap when nodes are created or moved
+        return to_node.altitude - from_node.altitude
 
     def create_node(self, position):
         x, y = position
@@ -54,26 +130,33 @@ class NavigationGraph():
         self.refresh_path_components()
 
     def refresh_path_components(self):
-        self.set_path_components()
-        self.redraw_all_edges()
+        # Only the edges of nodes that joined or left the path change shape, as their radius changed
+        for node in self.set_path_components():
+            self.redraw_edges(node)
         self.refresh_all_nodes()
 
     def set_path_components(self):
         self.set_path_edges()
-        self.set_path_nodes()
+        return self.set_path_nodes()
 
     def set_path_edges(self):
-        path_edge_tuples = self.pathfinder.get_path_edges()
+        path_edge_tuples = set(self.pathfinder.get_path_edges())
         for edge_tuple in self.graph.edges():
                 edge = self.get_edge_object(edge_tuple)
                 is_path_edge = edge_tuple in path_edge_tuples
-                edge.set_as_path_edge(is_path_edge=is_path_edge)
+                if edge.is_path_edge != is_path_edge:
+                    edge.set_as_path_edge(is_path_edge=is_path_edge)
 
     def set_path_nodes(self):
-        path_nodes = self.pathfinder.get_path_nodes()
+        # Returns the nodes whose path status changed
+        path_nodes = set(self.pathfinder.get_path_nodes())
+        changed_nodes = []
         for node in self.graph.nodes():
             is_path_node = node in path_nodes
+            if node.is_path_node() != is_path_node:
+                changed_nodes.append(node)
             node.set_as_path_node(is_path_node=is_path_node)
+        return changed_nodes
 
     def get_selected_nodes(self):
         return [node for node in self.graph.nodes() if node.is_selected()]
@@ -84,10 +167,40 @@ class NavigationGraph():
         y = from_node.y - to_node.y
         return math.sqrt(x * x + y * y)
 
+    def update_max_edge_length(self, edge_tuples):
+        for from_node, to_node in edge_tuples:
+            self.max_edge_length = max(self.max_edge_length, self.get_node_distance(from_node, to_node))
+
+    @staticmethod
+    def segment_intersects_rect(from_position, to_position, x_min, y_min, x_max, y_max):
+        # Liang-Barsky: clips the parameter range [0, 1] of the segment against each side of the rectangle
+        x, y = from_position
+        dx, dy = to_position[0] - x, to_position[1] - y
+        t_min, t_max = 0.0, 1.0
+        for p, q in ((-dx, x - x_min), (dx, x_max - x), (-dy, y - y_min), (dy, y_max - y)):
+            if p == 0:
+                if q < 0:
+                    return False
+                continue
+            t = q / p
+            if p < 0:
+                t_min = max(t_min, t)
+            else:
+                t_max = min(t_max, t)
+            if t_min > t_max:
+                return False
+        return True
+
+    @staticmethod
+    def get_max_node_radius():
+        # Upper bound of Node.get_padded_radius, reached by selected path nodes
+        world = config.world
+        return world.node_radius + world.path_radius_increase + world.selected_radius_increase + world.node_padding
+
     def is_valid_node_position(self, position, node_exceptions=None):
         if self._no_visuals:
             return True
-        for existing_node in self.graph.nodes():
+        for existing_node in self.spatial_index.query_radius(position, 2 * self.get_max_node_radius()):
             if node_exceptions and existing_node in node_exceptions:
                 continue
             distance = lib.get_point_distance(existing_node.get_position(), position)
@@ -96,10 +209,7 @@ class NavigationGraph():
         return True
 
     def get_node_from_position(self, position):
-        for node in self.graph.nodes():
-            if lib.get_point_distance(position, node.get_position()) < node.get_radius():
-                return node
-        return None
+        return self.spatial_index.query_point(position, self.get_max_node_radius(), lambda node: node.get_radius())
 
     def _set_node_state(self, node, state):
         node.set_state(state)
@@ -161,24 +271,14 @@ class NavigationGraph():
             self.add_edge(node, selected_node)
 
     def update_node_edges(self, node):
+        # Weights are updated at once, the shapes on the next edge refresh
         if not node in self.graph:
             return
-        for neighbor_node in nx.all_neighbors(self.graph, node):
-            def update_edge_weight(from_node, to_node):
-                if self.graph.has_edge(from_node, to_node):
-                    cost = self.pathfinder.calculate_edge_cost(from_node, to_node)
-                    # Default weight-attribute in NetworkX, used by e.g. AStarPathfinder
-                    self.graph[from_node][to_node][config.strings.weight] = cost
-
-            def update_edge_shape(from_node, to_node):
-                edge = self.get_edge_object((from_node, to_node))
-                if edge:
-                    edge.update_shape()
+        self.update_edge_weights(self.get_node_edge_tuples(node))
+        self.redraw_edges(node)
 
-            update_edge_weight(node, neighbor_node)
-            update_edge_weight(neighbor_node, node)
-            update_edge_shape(node, neighbor_node)
-            update_edge_shape(neighbor_node, node)
+    def get_node_edge_tuples(self, node):
+        return self.graph.in_edges(node) + self.graph.out_edges(node)
 
     def toggle_select(self, node, compare=None):
         if node:
@@ -229,14 +329,116 @@ class NavigationGraph():
         if node is None or not self.is_valid_node_position(node.get_position()):
             return False
         self.graph.add_node(node)
+        self.compact_graph.add_node(node)
+        self.spatial_index.insert(node, node.get_position())
+        if self.visible_nodes is not None:
+            # New nodes start out visible, the next culling pass hides them if they are outside the view
+            self.visible_nodes.add(node)
+            self.view_dirty = True
         self.node_set_dirty = True
         self.update_node_labels()
         return True
 
-    # def add_nodes_from(self, list_of_nodes):
-    #     self.graph.add_nodes_from(list_of_nodes)
-    #     self.node_set_dirty = True
-    #     self.update_node_labels()
+    def add_nodes_from(self, nodes, validate=True, update_compact_graph=True):
+        # Bulk add_node that returns the added nodes. Positions are checked through the spatial index, also
+        # against the nodes added before in the same call, and the labels are assigned once at the end.
+        added_nodes = []
+        for node in nodes:
+            if node is None or node in self.graph:
+                continue
+            if validate and not self.is_valid_node_position(node.get_position()):
+                continue
+            self.spatial_index.insert(node, node.get_position())
+            added_nodes.append(node)
+        if not added_nodes:
+            return added_nodes
+        self.graph.add_nodes_from(added_nodes)
+        if update_compact_graph:
+            for node in added_nodes:
+                self.compact_graph.add_node(node)
+        if self.visible_nodes is not None:
+            self.visible_nodes.update(added_nodes)
+            self.view_dirty = True
+        self.node_set_dirty = True
+        self.update_node_labels()
+        return added_nodes
+
+    def add_edges_from(self, edge_tuples, weights=None, update_compact_graph=True):
+        # Bulk add_edge that returns the added edge tuples. The weights of all new edges are computed in one
+        # vectorized pass unless given, and the pathfinder is notified once.
+        edge_tuples = list(edge_tuples)
+        new_edges = []
+        new_weights = []
+        seen = set()
+        for i, (from_node, to_node) in enumerate(edge_tuples):
+            if from_node is None or to_node is None or from_node == to_node:
+                continue
+            if from_node not in self.graph or to_node not in self.graph:
+                continue
+            if (from_node, to_node) in seen or self.graph.has_edge(from_node, to_node):
+                continue
+            seen.add((from_node, to_node))
+            new_edges.append((from_node, to_node))
+            if weights is not None:
+                new_weights.append(weights[i])
+        if not new_edges:
+            return new_edges
+        self.update_max_edge_length(new_edges)
+        if weights is None:
+            new_weights = self.pathfinder.calculate_edge_costs([u for u, v in new_edges],
+                                                               [v for u, v in new_edges]).tolist()
+        # Edge shapes are built on first draw
+        self.graph.add_edges_from((from_node, to_node, {config.strings.weight: weight,
+                                                        'object': Edge(from_node, to_node, skip_update=True)})
+                                  for (from_node, to_node), weight in zip(new_edges, new_weights))
+        if update_compact_graph:
+            for (from_node, to_node), weight in zip(new_edges, new_weights):
+                self.compact_graph.add_edge(from_node, to_node, weight)
+        if self.visible_edges is not None:
+            self.visible_edges.update(new_edges)
+            self.view_dirty = True
+        self.pathfinder.notify_graph_change()
+        self.node_set_dirty = True
+        return new_edges
+
+    def insert_graph(self, nodes, weighted_edges, update_compact_graph=True):
+        # Bulk insert of a saved graph: no position checks, and the weights are used as they are.
+        # weighted_edges holds (from_node, to_node, weight) tuples.
+        self.add_nodes_from(nodes, validate=False, update_compact_graph=update_compact_graph)
+        self.add_edges_from([(from_node, to_node) for from_node, to_node, weight in weighted_edges],
+                            weights=[weight for from_node, to_node, weight in weighted_edges],
+                            update_compact_graph=update_compact_graph)
+
+    def load_graph_file(self, filename):
+        # Replaces the graph with one written by save_graph_file, e.g. a large benchmark grid, instead of
+        # generating it again. The compact graph used by the pathfinders is built over the file's arrays.
+        graph_file = GraphFile(filename)
+        self.clear()
+        nodes = [Node(x, y, altitude=altitude) for x, y, altitude
+                 in zip(graph_file.x.tolist(), graph_file.y.tolist(), graph_file.altitude.tolist())]
+        from_ids, to_ids, weights = graph_file.get_edges()
+        weighted_edges = [(nodes[u], nodes[v], weight)
+                          for u, v, weight in zip(from_ids.tolist(), to_ids.tolist(), weights.tolist())]
+        self.compact_graph.load_graph_file(graph_file, nodes)
+        self.insert_graph(nodes, weighted_edges, update_compact_graph=False)
+        if graph_file.start is not None:
+            self.set_start_node(nodes[graph_file.start])
+        if graph_file.destination is not None:
+            self.set_destination_node(nodes[graph_file.destination])
+        return nodes
+
+    def save_graph_file(self, filename):
+        nodes = self.graph.nodes()
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = self.graph.edges(data=True)
+        positions = np.array([node.get_position() for node in nodes], dtype=np.float64).reshape(-1, 2)
+        altitudes = np.array([node.altitude for node in nodes], dtype=np.float64)
+        from_ids = np.array([index[u] for u, v, data in edges], dtype=np.int64)
+        to_ids = np.array([index[v] for u, v, data in edges], dtype=np.int64)
+        weights = np.array([data[config.strings.weight] for u, v, data in edges], dtype=np.float64)
+        GraphFile.write_edges(filename, positions[:, 0], positions[:, 1], altitudes, from_ids, to_ids, weights,
+                              start=index.get(self.pathfinder.start_node),
+                              destination=index.get(self.pathfinder.destination_node))
 
     def move_node(self, node, dx, dy):
         x, y = node.get_position()
@@ -245,16 +447,22 @@ class NavigationGraph():
             return False
 
         node.move(dx, dy)
-        self.redraw_edges(node)
+        self.update_max_edge_length(self.get_node_edge_tuples(node))
+        self.compact_graph.set_node_position(node, node.get_position())
+        self.spatial_index.move(node, node.get_position())
+        self.view_dirty = True
+        node.altitude = self.get_altitude(node.get_position())
+        self.compact_graph.set_node_altitude(node, node.altitude)
+        self.update_node_edges(node)
+        self.pathfinder.notify_graph_change()
         self.node_positions_dirty = True
 
     def redraw_edges(self, node):
-        if node not in self.update_edge_on_next:
-            self.update_edge_on_next.append(node)
+        if node in self.graph:
+            self.dirty_edges.update(self.get_node_edge_tuples(node))
 
     def redraw_all_edges(self):
-        for node in self.graph.nodes():
-            self.update_edge_on_next.append(node)
+        self.dirty_edges.update(self.graph.edges())
 
     def refresh_all_nodes(self):
         for node in self.graph.nodes():
@@ -279,10 +487,13 @@ class NavigationGraph():
         except nx.NetworkXError:
             return False
         else:
+            self.compact_graph.remove_node(node)
+            self.spatial_index.remove(node)
+            if self.visible_nodes is not None:
+                self.visible_nodes.discard(node)
             node.delete()
             self.node_set_dirty = True
-            if node in self.update_edge_on_next:
-                self.update_edge_on_next.remove(node)
+            self.dirty_edges = {(u, v) for u, v in self.dirty_edges if u is not node and v is not node}
             if self.pathfinder:
                 self.pathfinder.clear_node(node)
             self.update_node_labels()
@@ -299,9 +510,53 @@ class NavigationGraph():
         except nx.NetworkXError:
             return False
         else:
+            self.compact_graph.add_edge(from_node, to_node, weight)
+            self.update_max_edge_length([(from_node, to_node)])
+            self.pathfinder.notify_edge_change(from_node, to_node)
+            if self.visible_edges is not None:
+                self.visible_edges.add((from_node, to_node))
+                self.view_dirty = True
             self.node_set_dirty = True
             return True
 
+    def set_edge_weight(self, from_node, to_node, weight):
+        edge_data = self.graph[from_node][to_node]
+        if edge_data.get(config.strings.weight) == weight:
+            return False
+        # Default weight-attribute in NetworkX, used by e.g. AStarPathfinder
+        edge_data[config.strings.weight] = weight
+        self.compact_graph.set_edge_weight(from_node, to_node, weight)
+        self.pathfinder.notify_edge_change(from_node, to_node)
+        return True
+
+    def update_node_weights(self, node):
+        # Re-weight the edges ending in node, e.g. after its occupants changed
+        self.update_edge_weights([(predecessor, node) for predecessor in self.graph.predecessors(node)])
+
+    def update_edge_weights(self, edge_tuples=None):
+        # Recomputes the weights of the given edges, or of all edges, in one pass of the cost engine, e.g. after
+        # changing its coefficients. Returns the edge tuples whose weight changed.
+        compact_graph = self.compact_graph
+        if edge_tuples is None:
+            from_ids, to_ids = compact_graph.get_edge_ids()
+        else:
+            from_ids = np.array([compact_graph.get_id(u) for u, v in edge_tuples], dtype=np.int64)
+            to_ids = np.array([compact_graph.get_id(v) for u, v in edge_tuples], dtype=np.int64)
+        weights = self.pathfinder.cost_engine.calculate_costs(from_ids, to_ids)
+        changed = compact_graph.set_edge_weights(from_ids, to_ids, weights)
+        changed_edges = []
+        for u, v, weight in zip(from_ids[changed].tolist(), to_ids[changed].tolist(), weights[changed].tolist()):
+            from_node, to_node = compact_graph.get_node(u), compact_graph.get_node(v)
+            self.graph[from_node][to_node][config.strings.weight] = weight
+            changed_edges.append((from_node, to_node))
+        if edge_tuples is None:
+            if changed_edges:
+                self.pathfinder.notify_graph_change()
+        else:
+            for from_node, to_node in changed_edges:
+                self.pathfinder.notify_edge_change(from_node, to_node)
+        return changed_edges
+
     def remove_edge(self, from_node, to_node):
         edge = self.get_edge_object((from_node, to_node))
         if edge:
@@ -313,6 +568,10 @@ class NavigationGraph():
         except nx.NetworkXError:
             return False
         else:
+            self.compact_graph.remove_edge(from_node, to_node)
+            self.pathfinder.notify_edge_change(from_node, to_node)
+            if self.visible_edges is not None:
+                self.visible_edges.discard((from_node, to_node))
             self.node_set_dirty = True
             return True
 
@@ -341,11 +600,11 @@ class NavigationGraph():
     def update_node_labels(self):
         count = self.graph.number_of_nodes()
         all_labels = [str(i) for i in range(1, count+1)]
-        used_labels = []
+        used_labels = set()
         unlabeled_nodes = []
         for node in self.graph.nodes():
             if node.label and int(node.label) <= count:
-                used_labels.append(node.label)
+                used_labels.add(node.label)
             else:
                 unlabeled_nodes.append(node)
 
@@ -356,11 +615,82 @@ class NavigationGraph():
             label = unused_labels[i]
             node.set_label(label)
 
-    # TODO: batched rendering of primitives
+    def set_view(self, view_rect, zoom=1.0):
+        # World rectangle (x_min, y_min, x_max, y_max) shown by the window and its zoom, e.g. from a Camera
+        if view_rect == self.view_rect and zoom == self.view_zoom:
+            return
+        if zoom != self.view_zoom:
+            shapelib.set_view_scale(zoom)
+            self.tessellation_dirty = True
+        self.view_rect = view_rect
+        self.view_zoom = zoom
+        self.view_dirty = True
+
+    def update_visibility(self):
+        # Culls nodes and edges outside the view through the spatial index and applies the level of detail of the
+        # zoom. Edges are kept while they cross the view, also with both nodes outside it.
+        world = config.world
+        zoom = self.view_zoom
+        self.show_labels = zoom >= world.lod_label_zoom
+        self.show_arrows = zoom >= world.lod_arrow_zoom
+        show_edges = zoom >= world.lod_edge_zoom
+        margin = self.get_max_node_radius()
+        x_min, y_min, x_max, y_max = self.view_rect
+        x_min, y_min, x_max, y_max = x_min-margin, y_min-margin, x_max+margin, y_max+margin
+        nodes = set(self.spatial_index.query_rect(x_min, y_min, x_max, y_max))
+        edges = set()
+        if show_edges:
+            # No edge crossing the view has both nodes farther from it than the longest edge
+            reach = self.max_edge_length
+            for node in self.spatial_index.query_rect(x_min-reach, y_min-reach, x_max+reach, y_max+reach):
+                for edge_tuple in self.get_node_edge_tuples(node):
+                    from_node, to_node = edge_tuple
+                    if edge_tuple in edges:
+                        continue
+                    if from_node in nodes or to_node in nodes or \
+                            self.segment_intersects_rect(from_node.get_position(), to_node.get_position(),
+                                                         x_min, y_min, x_max, y_max):
+                        edges.add(edge_tuple)
+
+        old_nodes = set(self.graph.nodes()) if self.visible_nodes is None else self.visible_nodes
+        old_edges = set(self.graph.edges()) if self.visible_edges is None else self.visible_edges
+        for node in old_nodes - nodes:
+            node.set_visible(False)
+        for edge_tuple in old_edges - edges:
+            edge = self.get_edge_object(edge_tuple)
+            if edge:
+                edge.set_visible(False)
+        for node in nodes:
+            node.set_visible(True, show_label=self.show_labels)
+            if self.tessellation_dirty:
+                node.update_tessellation()
+        for edge_tuple in edges:
+            edge = self.get_edge_object(edge_tuple)
+            if edge:
+                edge.set_visible(True, show_arrows=self.show_arrows)
+                if self.tessellation_dirty:
+                    edge.update_tessellation()
+        self.visible_nodes = nodes
+        self.visible_edges = edges
+        self.view_dirty = False
+        self.tessellation_dirty = False
+
+    def get_drawn_nodes(self):
+        if self.visible_nodes is None:
+            return self.graph.nodes()
+        return self.visible_nodes
+
+    def get_drawn_edges(self):
+        if self.visible_edges is None:
+            return self.graph.edges()
+        return self.visible_edges
+
     def draw(self):
+        if self.view_rect is not None and self.view_dirty:
+            self.update_visibility()
         selected_nodes = self.get_selected_nodes()
-        path_edges = self.pathfinder.get_path_edges()
         batch = self.render_batch
+        drawn_nodes = self.get_drawn_nodes()
 
         def draw_path():
             if self.pathfinder:
@@ -368,39 +698,36 @@ class NavigationGraph():
         draw_path()
 
         def draw_edges():
-            for edge in self.graph.edges(data=True):
-                if edge in path_edges:
-                    pass
-                else:
-                    self.get_edge_object(edge).draw(batch)
+            for edge_tuple in self.get_drawn_edges():
+                edge = self.get_edge_object(edge_tuple)
+                if edge:
+                    edge.draw(batch)
         draw_edges()
 
         def draw_selected_nodes():
             for selected_node in selected_nodes:
-                selected_node.draw_selected_indicator(batch)
+                if self.visible_nodes is None or selected_node in self.visible_nodes:
+                    selected_node.draw_selected_indicator(batch)
         draw_selected_nodes()
 
         def draw_nodes():
-            is_reading_data = True
-            for node in self.graph.nodes(data=is_reading_data):
-                node_instance = node
-                if is_reading_data:
-                    node_instance = node[0]
-
-                node_instance.draw_path(batch)
-                if node_instance in selected_nodes:
-                    node_instance.draw(radius_offset=config.world.selected_radius_decrease, batch=batch)
+            for node in drawn_nodes:
+                node.draw_path(batch)
+                if node.is_selected():
+                    node.draw(radius_offset=config.world.selected_radius_decrease, batch=batch)
                 else:
-                    node_instance.draw(batch=batch)
+                    node.draw(batch=batch)
         draw_nodes()
 
-        self.render_batch.draw()
-
         def draw_node_labels():
-            for node in self.graph.nodes():
-                node.draw_label()
+            if not self.show_labels:
+                return
+            for node in drawn_nodes:
+                node.draw_label(batch)
         draw_node_labels()
 
+        self.render_batch.draw()
+
     def update(self, dt):
         self.update_nodes(dt)
         self.update_edges(dt)
@@ -414,8 +741,9 @@ class NavigationGraph():
     def add_occupant(self, node, occupant=True):
         if not node.has_occupants() and node.state is Node.State.Default:
             node.add_occupant(occupant)
+            self.compact_graph.set_node_blocked(node, True)
             self.node_set_dirty = True
-            # self.update_node_edges(node)
+            self.update_node_weights(node)
             self.pathfinder.notify_node_change(node)
 
     def remove_occupant(self, node, occupant=True, remove_all=False):
@@ -424,8 +752,9 @@ class NavigationGraph():
                 node.remove_all_occupants()
             else:
                 node.remove_occupant(occupant)
+            self.compact_graph.set_node_blocked(node, node.has_occupants())
             self.node_set_dirty = True
-            # self.update_node_edges(node)
+            self.update_node_weights(node)
             self.pathfinder.notify_node_change(node)
 
     def update_nodes(self, dt):
@@ -435,10 +764,11 @@ class NavigationGraph():
     def update_edges(self, dt):
         self.edge_update_timer += dt
         if self.edge_update_timer > config.world.edge_refresh_interval:
-            for node in self.update_edge_on_next:
-                self.update_node_edges(node)
+            edges = [self.get_edge_object(edge_tuple) for edge_tuple in self.dirty_edges
+                     if self.graph.has_edge(*edge_tuple)]
+            Edge.update_shapes(edge for edge in edges if edge)
             self.edge_update_timer = 0
-            self.update_edge_on_next.clear()
+            self.dirty_edges.clear()
 
     def update_path(self, dt):
         must_reevaluate_path = self.node_positions_dirty or self.node_set_dirty
@@ -454,7 +784,9 @@ class NavigationGraph():
         pass
 
     def find_nearest_nodes(self, node, number_of_hits=1, candidates=None, exceptions=()):
-        candidates = self.graph.nodes() if not candidates else candidates
+        if not candidates:
+            return self.spatial_index.nearest(node.get_position(), number_of_hits,
+                                              lambda candidate: candidate != node and candidate not in exceptions)
         candidates = [candidate for candidate in candidates if candidate != node and candidate not in exceptions]
 
         def key_function(candidate):
@@ -467,6 +799,14 @@ class NavigationGraph():
         nodes = self.graph.nodes()
         for node in nodes:
             self.remove_node(node)
+        self.compact_graph.clear()
+        if self.pathfinder.path_cache is not None:
+            self.pathfinder.path_cache.clear()
+        self.spatial_index.clear()
+        self.max_edge_length = 0.0
+        if self.visible_nodes is not None:
+            self.visible_nodes = set()
+            self.visible_edges = set()
         if print_msg:
             print("All nodes and edges removed.")
 
@@ -513,10 +853,9 @@ class NavigationGraph():
                 if odd:
                     y += hex_offset
                 if not (odd and make_hex) or row_i < row_count - 1:
-                    node = self.create_node((x, y))
-                    nodes.append(node)
-                    self.add_node(node)
+                    nodes.append(self.create_node((x, y)))
                 odd = not odd
+        self.add_nodes_from(nodes)
 
         w2 = col_step * col_step
         h2 = row_step * row_step
@@ -528,19 +867,34 @@ class NavigationGraph():
 
         nodes = self.graph.nodes()
         random.shuffle(nodes)
+        shuffled_order = {node: i for i, node in enumerate(nodes)}
+
+        # The edges are collected with their degrees counted here and then added in one bulk insert,
+        # in the order add_edge would have added them one by one
+        degrees = {node: self.graph.degree(node) for node in nodes}
+        edge_tuples = []
+        edge_set = set()
+
+        def collect_edge(from_node, to_node):
+            if from_node is to_node or (from_node, to_node) in edge_set or self.graph.has_edge(from_node, to_node):
+                return
+            edge_set.add((from_node, to_node))
+            edge_tuples.append((from_node, to_node))
+            degrees[from_node] += 1
+            degrees[to_node] += 1
 
         for node in nodes:
-            def is_near(candidate):
-                return NavigationGraph.get_node_distance(candidate, node) < max_near_distance
-            neighbors = [candidate for candidate in nodes if is_near(candidate)]
+            # Neighbors in shuffled order, as the degree limit makes the edges depend on it
+            neighbors = self.spatial_index.query_radius(node.get_position(), max_near_distance)
+            neighbors.sort(key=shuffled_order.get)
             max_degree = 6
             for neighbor in neighbors:
-                degree = self.graph.degree(neighbor)
-                if degree < max_degree:
+                if degrees[neighbor] < max_degree:
                     # val = random.random()*100
                     # if val > degree/max_degree*75:
-                    self.add_edge(neighbor, node)
-                    self.add_edge(node, neighbor)
+                    collect_edge(neighbor, node)
+                    collect_edge(node, neighbor)
+        self.add_edges_from(edge_tuples)
 
     def neighbors_of(self, node):
         try:
@@ -32,25 +32,51 @@ class Node:
         self.z_path = self.z - 10
         self.z_selected = self.z_path - 10
         self.label = None
-        text_label = "" if not self.label else self.label
-        self.text_label = pyglet.text.Label(text_label,
-                                            font_name='Times New Roman',
-                                            font_size=0.61*self.current_radius,
-                                            x=self.x, y=self.y,
-                                            anchor_x='center', anchor_y='center',
-                                            color=lib.rgba(config.world.node_label_color),
-                                            group=pyglet.graphics.OrderedGroup(-100000))
         self.altitude = altitude
         self.content = content
         self.occupants = []
-        self.batch_group = pyglet.graphics.OrderedGroup(config.world.node_order_index)
-        self.circle = shapelib.OutlinedCircle((x, y), self.current_radius, self.current_color, z=self.z, dz=1)
+        # Render objects are created on first use, so nodes of a graph that is never drawn stay plain data
+        self._text_label = None
+        self._label_batch = None
+        self._label_dirty = False   # Text or position changed since the label was last laid out
+        self._batch_group = None
+        self._circle = None
+        self._visible = True    # False while culled from the view
         self.path_circle = None
         self.select_circle = None
         self.state = self.State.Default
         self._is_path_node = False
         self._is_selected = is_selected
 
+    @property
+    def text_label(self):
+        if self._text_label is None:
+            text_label = "" if not self.label else self.label
+            self._text_label = pyglet.text.Label(text_label,
+                                                 font_name='Times New Roman',
+                                                 font_size=0.61*self.current_radius,
+                                                 x=self.x, y=self.y,
+                                                 anchor_x='center', anchor_y='center',
+                                                 color=lib.rgba(config.world.node_label_color),
+                                                 batch=self._label_batch,
+                                                 group=shapelib.get_layer_group(config.world.z_indexes.label))
+            self._label_dirty = False
+        return self._text_label
+
+    @property
+    def batch_group(self):
+        if self._batch_group is None:
+            self._batch_group = pyglet.graphics.OrderedGroup(config.world.node_order_index)
+        return self._batch_group
+
+    @property
+    def circle(self):
+        if self._circle is None:
+            self._circle = shapelib.OutlinedCircle(self.get_position(), self.current_radius, self.current_color,
+                                                   z=self.z, dz=1)
+            self._circle.set_visible(self._visible)
+        return self._circle
+
     def __repr__(self):
         return "{} #{} {},{}".format(self.__class__.__name__, self.label, self.x_print, self.y_print)
 
@@ -84,34 +110,22 @@ class Node:
         return lib.get_point_distance(self.get_position(), node.get_position())
 
     def set_label(self, label):
-        self.label = label
-        if self.text_label:
-            self.text_label.text = self.label
+        if label != self.label:
+            self.label = label
+            self._label_dirty = True
 
+    # The indicator circles are created by update(), which only runs for graphs that are drawn
     def set_as_selected(self, selected):
         self._is_selected = selected
-        if selected:
-            pos = self.get_position()
-            radius = self.get_selected_radius()
-            color = config.world.selected_node_color
-            if self.select_circle is None or self.select_circle.radius != radius:
-                self.select_circle = shapelib.OutlinedCircle(pos, radius=radius, color=color, z=self.z_selected)
-        elif self.select_circle:
+        if not selected and self.select_circle:
             self.select_circle.delete()
             self.select_circle = None
 
     def set_as_path_node(self, is_path_node=True):
         self._is_path_node = is_path_node
-        if is_path_node:
-            pos = self.get_position()
-            radius = self.get_path_radius()
-            color = config.world.path_edge_color
-            if not self.path_circle:
-                self.path_circle = shapelib.OutlinedCircle(pos, radius, color, z=self.z_path)
-        else:
-            if self.path_circle:
-                self.path_circle.delete()
-                self.path_circle = None
+        if not is_path_node and self.path_circle:
+            self.path_circle.delete()
+            self.path_circle = None
 
     def is_selected(self):
         return self._is_selected
@@ -121,10 +135,13 @@ class Node:
 
     def update_selected_indicator(self):
         if self.is_selected():
-            circle = self.select_circle
             pos = self.get_position()
             radius = self.get_selected_radius()
             color = config.world.selected_node_color
+            if self.select_circle is None:
+                self.select_circle = shapelib.OutlinedCircle(pos, radius=radius, color=color, z=self.z_selected)
+                self.select_circle.set_visible(self._visible)
+            circle = self.select_circle
             if circle.get_position() != pos:
                 circle.set_position(pos)
             if circle.radius != radius:
@@ -134,10 +151,13 @@ class Node:
 
     def update_path_indicator(self):
         if self.is_path_node():
-            circle = self.path_circle
             pos = self.get_position()
             radius = self.get_path_radius()
             color = config.world.path_edge_color
+            if self.path_circle is None:
+                self.path_circle = shapelib.OutlinedCircle(pos, radius, color, z=self.z_path)
+                self.path_circle.set_visible(self._visible)
+            circle = self.path_circle
             if circle.get_position() != pos:
                 circle.set_position(pos)
             if circle.radius != radius:
@@ -147,7 +167,8 @@ class Node:
 
     def set_radius(self, new_radius):
         self.current_radius = new_radius
-        self.circle.set_radius(self.current_radius)
+        if self._circle:
+            self._circle.set_radius(self.current_radius)
 
     def set_state(self, state):
         # print("Setting new state: {0}".format(state))
@@ -160,8 +181,9 @@ class Node:
         if new_position is None:
             return False
         self.x, self.y = new_position
-        self.circle.set_position(new_position)
-        self.text_label.x, self.text_label.y = new_position
+        if self._circle:
+            self._circle.set_position(new_position)
+        self._label_dirty = True
         if self.select_circle:
             self.select_circle.set_position(new_position)
         if self.path_circle:
@@ -194,9 +216,35 @@ class Node:
     def get_position(self):
         return self.x, self.y
 
-    def draw_label(self):
-        if self.text_label:
-            self.text_label.draw()
+    def draw_label(self, batch=None):
+        # A label in a batch is drawn by batch.draw() and only laid out again when its text or position changed
+        if self._text_label is None:
+            self._label_batch = batch
+        text_label = self.text_label
+        if self._label_dirty:
+            text_label.begin_update()
+            text_label.text = "" if not self.label else self.label
+            text_label.x, text_label.y = self.get_position()
+            text_label.end_update()
+            self._label_dirty = False
+        if self._label_batch is None:
+            text_label.draw()
+
+    def get_circles(self):
+        return [circle for circle in (self._circle, self.select_circle, self.path_circle) if circle]
+
+    def set_visible(self, visible, show_label=True):
+        # Culled nodes leave the render batch. Their label is deleted, and created again when drawn.
+        self._visible = visible
+        for circle in self.get_circles():
+            circle.set_visible(visible)
+        if self._text_label and not (visible and show_label):
+            self._text_label.delete()
+            self._text_label = None
+
+    def update_tessellation(self):
+        for circle in self.get_circles():
+            circle.update_tessellation()
 
     def draw_selected_indicator(self, batch=None):
         if self.is_selected() and self.select_circle:
@@ -226,11 +274,16 @@ class Node:
         self.circle.set_color(color)
 
     def get_color(self):
-        return self.circle.color if self.circle.color else config.world.node_color
+        if self._circle is None:
+            return self.current_color
+        return self._circle.color if self._circle.color else config.world.node_color
 
     def delete(self):
-        if self.circle:
-            self.circle.delete()
+        if self._circle:
+            self._circle.delete()
+        if self._text_label:
+            self._text_label.delete()
+            self._text_label = None
         if self.select_circle:
             self.select_circle.delete()
         if self.path_circle:
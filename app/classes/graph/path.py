@@ -1,5 +1,4 @@
 from app.config import config
-from app.pythomas import shapes as shapelib
 from app.pythomas import pythomas as lib
 
 
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+
+from app.config import config
+from app.classes.graph.compact_graph import CompactGraph
+
+
+class PathCache:
+    # Shortest paths by (start, destination, weights key), evicted least recently used first. The weights key of
+    # CompactGraph.get_weights_key identifies the edges and weights a path was found with, so a path is reused
+    # exactly when the graph has the same weights again: selecting nodes, or blocking and unblocking the same
+    # nodes again as the Analyzer does, never causes a second search. Any other change, e.g. moving a node, gives
+    # new keys. Entries of an older topology can never match again and are dropped when the topology changes.
+    def __init__(self, compact_graph, max_size=None):
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
+        self.max_size = config.world.path_cache_size if max_size is None else max_size
+        self.entries = OrderedDict()    # (start, destination, weights key) -> nodes
+        self.topology_version = None    # Of the entries
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _get_key(self, start, destination):
+        weights_key = self.compact_graph.get_weights_key()
+        if weights_key[0] != self.topology_version:
+            self.entries.clear()
+            self.topology_version = weights_key[0]
+        return start, destination, weights_key
+
+    def get(self, start, destination):
+        # The cached nodes of the path, None when not cached for the current weights
+        key = self._get_key(start, destination)
+        nodes = self.entries.get(key)
+        if nodes is None:
+            self.miss_count += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hit_count += 1
+        return list(nodes)
+
+    def put(self, start, destination, nodes):
+        key = self._get_key(start, destination)
+        self.entries[key] = list(nodes)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
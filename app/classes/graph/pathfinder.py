@@ -1,25 +1,39 @@
 from enum import Enum
 import math
 import networkx as nx
+import numpy as np
 import pyglet
 
 from app.pythomas import pythomas as lib
 from app.config import config, global_string_values as strings
 from app.classes.graph.path import Path
 from app.classes.graph.node import Node
+from app.classes.graph.compact_graph import CompactGraph
+from app.classes.graph.edge_cost_engine import EdgeCostEngine
+from app.classes.graph.astar_engine import AStarEngine
+from app.classes.graph.contraction_hierarchy import ContractionHierarchy
+from app.classes.graph.path_cache import PathCache
 
 
 class Pathfinder(pyglet.event.EventDispatcher):
     event_type_on_path_update = strings.events.on_path_update
 
-    def __init__(self, graph, altitude_function=None):
+    def __init__(self, graph, altitude_function=None, compact_graph=None):
         self.graph = graph
+        self.compact_graph = compact_graph
+        if False:
+            self.compact_graph = CompactGraph()
         self.start_node = None
         self.destination_node = None
         self.path = None
         if False:
             self.path = Path(None)
         self.altitude_function = altitude_function
+        # Holds the coefficients of the edge cost model
+        self.cost_engine = EdgeCostEngine(compact_graph, use_altitude=altitude_function is not None)
+        self.landmarks = None   # ALT heuristic tables, set by NavigationGraph.build_landmarks
+        # Paths of waypoint segments, by the weights they were found with
+        self.path_cache = PathCache(compact_graph) if compact_graph is not None else None
         self.refresh_timer = 0
         self._refresh_path = False
         self.waypoints = []
@@ -44,22 +58,22 @@ class Pathfinder(pyglet.event.EventDispatcher):
         return self.graph[u][v][config.strings.weight]
 
     def calculate_edge_cost(self, from_node, to_node):
-        if to_node.has_occupants():
-            return config.world.blocked_node_edge_cost
-        max_slope = 2   # 60 degrees
-        min_slope = -2  # -60 degrees
-        slope_width = abs(max_slope - min_slope)
-        altitude_wgt_coefficient = 1
-        distance_coefficient = 1
         distance = lib.get_point_distance(from_node.get_position(), to_node.get_position())
         alt_raise = 0 if not self.altitude_function else self.altitude_function(from_node, to_node)
-        slope = alt_raise/distance if distance else 0
-        alt_contribution = float("inf")  # Float representation of infinity
-        if min_slope < slope < max_slope:
-            alt_contribution = slope - min_slope
-        dist_cost = distance
-        alt_cost = alt_contribution / slope_width * distance
-        return dist_cost * distance_coefficient + altitude_wgt_coefficient * alt_cost
+        return self.cost_engine.calculate_cost(distance, alt_raise, to_node.has_occupants())
+
+    def calculate_edge_costs(self, from_nodes, to_nodes):
+        # calculate_edge_cost of many edges in one pass, as an array
+        if self.compact_graph is None:
+            return np.array([self.calculate_edge_cost(from_node, to_node)
+                             for from_node, to_node in zip(from_nodes, to_nodes)], dtype=np.float64)
+        get_id = self.compact_graph.get_id
+        return self.cost_engine.calculate_costs([get_id(node) for node in from_nodes],
+                                                [get_id(node) for node in to_nodes])
+
+    def set_landmarks(self, landmarks):
+        # Override in pathfinders whose heuristic can use the landmark bounds
+        self.landmarks = landmarks
 
     def notify_node_change(self, node):
         path_nodes = self.get_path_nodes()
@@ -71,6 +85,15 @@ class Pathfinder(pyglet.event.EventDispatcher):
                 # self.split_path_on_waypoint(previous_node)
                 self.update_to_new_path()
 
+    def notify_edge_change(self, from_node, to_node):
+        # Called by NavigationGraph when an edge is added, removed or re-weighted.
+        # Override in pathfinders that keep search state between queries.
+        pass
+
+    def notify_graph_change(self):
+        # Called by NavigationGraph when node positions changed
+        pass
+
     def set_start_node(self, node):
         if self.destination_node == node:
             self.destination_node = None
@@ -166,7 +189,7 @@ class Pathfinder(pyglet.event.EventDispatcher):
         for i in range(1, len(nodes)):
             self.start_node = nodes[i-1]
             self.destination_node = nodes[i]
-            paths.append(self.create_path())
+            paths.append(self.create_cached_path())
         result_nodes = [paths[0].first()]
         for path in paths:
             result_nodes.extend(path.get_node_list()[1:])
@@ -184,6 +207,17 @@ class Pathfinder(pyglet.event.EventDispatcher):
     def create_path(self):
         return None
 
+    def create_cached_path(self):
+        # create_path for the current start and destination, answered from the path cache when possible
+        if self.path_cache is None:
+            return self.create_path()
+        nodes = self.path_cache.get(self.start_node, self.destination_node)
+        if nodes is not None:
+            return Path(nodes)
+        path = self.create_path()
+        self.path_cache.put(self.start_node, self.destination_node, path.get_node_list())
+        return path
+
     def update(self, dt):
         self.refresh_timer += dt
 
@@ -225,16 +259,36 @@ Pathfinder.register_event_type(Pathfinder.event_type_on_path_update)
 
 
 class AStarPathfinder(Pathfinder):
-    def __init__(self, graph, altitude_function=None):
-        Pathfinder.__init__(self, graph, altitude_function)
+    def __init__(self, graph, altitude_function=None, compact_graph=None):
+        Pathfinder.__init__(self, graph, altitude_function, compact_graph)
+        # Search the integer-indexed CSR mirror when available. Only valid for the default Euclidean heuristic.
+        self.use_compact_graph = True
+        self.astar_engine = AStarEngine(compact_graph) if compact_graph is not None else None
+        # Search from both path ends at once, which expands about half as many nodes on long paths
+        self.bidirectional = False
 
         def heuristics(from_node, to_node):
             return from_node.get_distance_to(to_node)
         self.heuristic_function = heuristics
+        self.euclidean_heuristic_function = heuristics
+
+    def set_landmarks(self, landmarks):
+        Pathfinder.set_landmarks(self, landmarks)
+        if self.astar_engine is not None:
+            self.astar_engine.set_landmarks(landmarks)
+        self.heuristic_function = landmarks.heuristic if landmarks is not None else self.euclidean_heuristic_function
 
     def create_path(self):
         nodes = []
-        if self.start_node and self.destination_node:
+        if self.start_node and self.destination_node and self.use_compact_graph and self.astar_engine is not None:
+            return Path(self.astar_engine.find_path(self.start_node, self.destination_node, self.bidirectional))
+        if self.start_node and self.destination_node and self.bidirectional:
+            try:
+                length, nodes = nx.bidirectional_dijkstra(self.graph, self.start_node, self.destination_node,
+                                                          weight=config.strings.weight)
+            except nx.NetworkXNoPath:
+                pass
+        elif self.start_node and self.destination_node:
             try:
                 nodes = nx.astar_path(self.graph, self.start_node, self.destination_node,
                                       heuristic=self.heuristic_function,
@@ -245,6 +299,42 @@ class AStarPathfinder(Pathfinder):
         return path
 
 
+class ContractionHierarchyPathfinder(AStarPathfinder):
+    # Answers queries from a ContractionHierarchy, built on the first query and again after topology changes.
+    # Queries the hierarchy can not answer, e.g. paths over blocked nodes, fall back to AStarPathfinder.
+    # Only the costs are those of AStarPathfinder: between paths of equal cost the routes may differ.
+    verify_paths = False    # For development: also search with A* and compare every hierarchy path
+
+    def __init__(self, graph, altitude_function=None, compact_graph=None):
+        AStarPathfinder.__init__(self, graph, altitude_function, compact_graph)
+        self.contraction_hierarchy = ContractionHierarchy(compact_graph, self.cost_engine)
+        self.verified_count = 0
+        self.differing_route_count = 0  # Verified paths of A* cost along another route
+
+    def create_path(self):
+        if self.start_node and self.destination_node:
+            if not self.contraction_hierarchy.is_valid():
+                # The cost engine may have been handed over by NavigationGraph.set_pathfinder
+                self.contraction_hierarchy.cost_engine = self.cost_engine
+                self.contraction_hierarchy.build()
+            nodes = self.contraction_hierarchy.find_path(self.start_node, self.destination_node)
+            if nodes is not None:
+                path = Path(nodes)
+                if self.verify_paths:
+                    self.verify_path(path)
+                return path
+        return AStarPathfinder.create_path(self)
+
+    def verify_path(self, path):
+        astar_path = AStarPathfinder.create_path(self)
+        cost, astar_cost = self.get_path_cost(path), self.get_path_cost(astar_path)
+        if abs(cost - astar_cost) > 1e-9 * max(1.0, abs(astar_cost)):
+            raise ValueError("Contraction hierarchy path costs {}, A* path {}".format(cost, astar_cost))
+        self.verified_count += 1
+        if path.get_node_list() != astar_path.get_node_list():
+            self.differing_route_count += 1
+
+
 class CustomPathfinder(Pathfinder):
     class State(Enum):
         Unassigned = 0
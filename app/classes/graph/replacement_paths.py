@@ -0,0 +1,145 @@
+import numpy as np
+
+from heapq import heappush, heappop
+
+
+class ReplacementPaths:
+    # Detour costs for blocking each interior node of a shortest path, computed from one forward
+    # shortest-path tree (from the start) and one backward tree (to the destination) instead of
+    # one full search per blocked node.
+    #
+    # Both trees are forced to contain the path itself. For a node u, branch(u) is the index of the last
+    # path node on the tree path start -> u, and merge(x) the index of the first path node on the tree path
+    # x -> destination. An edge (u, x) then bypasses every path index i with branch(u) < i < merge(x), at
+    # cost dist(start, u) + w(u, x) + dist(x, destination). Each path index is assigned its cheapest such
+    # edge. Every such detour is a real path avoiding the blocked node, but on a directed graph the best detour
+    # may leave the trees more than once, so a tree detour is only an upper bound. It is exact when it costs
+    # no more than the path itself. Every other index, including those without a tree detour, is settled by
+    # search_avoiding, an A* around the blocked node bounded by the tree detour.
+    tolerance = 1e-9
+
+    def __init__(self, compact_graph):
+        self.compact_graph = compact_graph
+        if False:
+            from app.classes.graph.compact_graph import CompactGraph
+            self.compact_graph = CompactGraph()
+
+    def compute(self, path_nodes):
+        # Returns {interior path node: cost of the best path avoiding it}, infinite where no detour exists.
+        # Returns None if the path is not a shortest path in the compact graph (e.g. it runs through
+        # waypoints), in which case the trees cannot describe it.
+        graph = self.compact_graph
+        infinity = float("inf")
+        path_ids = [graph.get_id(node) for node in path_nodes]
+        if len(path_ids) < 3 or None in path_ids:
+            return None
+        path_index = {node_id: i for i, node_id in enumerate(path_ids)}
+        if len(path_index) != len(path_ids):
+            return None
+
+        path_cost = 0.0
+        prefix_costs = [0.0]
+        for u, v in zip(path_ids, path_ids[1:]):
+            weight = graph.get_edge_weight(path_nodes[path_index[u]], path_nodes[path_index[v]])
+            if weight is None or weight == infinity:
+                return None
+            path_cost += weight
+            prefix_costs.append(path_cost)
+
+        start_id, destination_id = path_ids[0], path_ids[-1]
+        from_start, forward_parents, forward_order = graph.shortest_path_tree(start_id)
+        to_destination, backward_parents, backward_order = graph.shortest_path_tree(destination_id, reverse=True)
+        if from_start[destination_id] < path_cost - self.tolerance * max(1.0, path_cost):
+            return None
+
+        # Force the path into both trees. Distances along it equal the tree distances since it is shortest.
+        for i in range(1, len(path_ids)):
+            forward_parents[path_ids[i]] = path_ids[i-1]
+            from_start[path_ids[i]] = prefix_costs[i]
+        for i in range(len(path_ids) - 1):
+            backward_parents[path_ids[i]] = path_ids[i+1]
+            to_destination[path_ids[i]] = path_cost - prefix_costs[i]
+
+        size = graph.get_size()
+        last_index = len(path_ids) - 1
+        branch = [last_index + 1] * size   # Unreached ids can not bypass anything
+        for node_id in forward_order:
+            if node_id in path_index:
+                branch[node_id] = path_index[node_id]
+            else:
+                branch[node_id] = branch[forward_parents[node_id]]
+        merge = [-1] * size
+        for node_id in backward_order:
+            if node_id in path_index:
+                merge[node_id] = path_index[node_id]
+            else:
+                merge[node_id] = merge[backward_parents[node_id]]
+
+        # Candidate detour for every edge, in one array expression
+        indptr, indices, weights = graph.csr()
+        sources = np.repeat(np.arange(size), np.diff(indptr))
+        branch = np.array(branch, dtype=np.int64)
+        merge = np.array(merge, dtype=np.int64)
+        costs = np.array(from_start)[sources] + weights + np.array(to_destination)[indices]
+        first = branch[sources] + 1
+        last = merge[indices] - 1
+        valid = np.isfinite(costs) & (first <= last)
+        costs, first, last = costs[valid], first[valid], last[valid]
+        order = np.argsort(costs, kind='stable')
+
+        # Cheapest candidate covering each index. next_free is a union-find over unassigned indices.
+        detours = [infinity] * len(path_ids)
+        next_free = list(range(len(path_ids) + 1))
+
+        def find(i):
+            root = i
+            while next_free[root] != root:
+                root = next_free[root]
+            while next_free[i] != root:
+                next_free[i], i = root, next_free[i]
+            return root
+
+        remaining = len(path_ids) - 2
+        for cost, lo, hi in zip(costs[order].tolist(), first[order].tolist(), last[order].tolist()):
+            i = find(lo)
+            while i <= hi:
+                detours[i] = cost
+                next_free[i] = i + 1
+                remaining -= 1
+                i = find(i + 1)
+            if remaining <= 0:
+                break
+
+        exact_cost = path_cost + self.tolerance * max(1.0, path_cost)
+        for i in range(1, last_index):
+            if detours[i] > exact_cost:
+                detours[i] = self.search_avoiding(start_id, destination_id, path_ids[i], to_destination, detours[i])
+        return {path_nodes[i]: detours[i] for i in range(1, last_index)}
+
+    def search_avoiding(self, start_id, destination_id, excluded_id, to_destination, upper_bound):
+        # Cost of the cheapest path from start_id to destination_id around excluded_id, or upper_bound if none
+        # is cheaper. The unblocked distances to the destination can only grow when a node is left out, so
+        # they are a consistent heuristic, and the search stops once no key is below upper_bound.
+        infinity = float("inf")
+        indptr, indices, weights = self.compact_graph.csr_lists()
+        g_scores = {start_id: 0.0}
+        closed = set()
+        queue = [(to_destination[start_id], 0.0, start_id)]
+        while queue:
+            key, dist, current = heappop(queue)
+            if key >= upper_bound:
+                break
+            if current == destination_id:
+                return dist
+            if current in closed:
+                continue
+            closed.add(current)
+            for i in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[i]
+                if neighbor == excluded_id or neighbor in closed:
+                    continue
+                ncost = dist + weights[i]
+                if ncost < g_scores.get(neighbor, infinity):
+                    g_scores[neighbor] = ncost
+                    heappush(queue, (ncost + to_destination[neighbor], ncost, neighbor))
+        return upper_bound
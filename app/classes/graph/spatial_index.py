@@ -0,0 +1,142 @@
+import math
+
+
+class SpatialIndex:
+    # Uniform grid hash from cells of cell_size x cell_size to the items positioned in them.
+    # Point and radius queries only visit the cells overlapping the query circle, and
+    # k-nearest queries search outwards ring by ring until the hits can not get any closer.
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = dict()
+        self.positions = dict()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def get_cell(self, position):
+        x, y = position
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def insert(self, item, position):
+        if item in self.positions:
+            self.remove(item)
+        position = tuple(position)
+        self.positions[item] = position
+        self.cells.setdefault(self.get_cell(position), []).append(item)
+
+    def remove(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return False
+        cell = self.get_cell(position)
+        items = self.cells[cell]
+        items.remove(item)
+        if not items:
+            del self.cells[cell]
+        return True
+
+    def move(self, item, position):
+        old_position = self.positions.get(item)
+        position = tuple(position)
+        if old_position is not None and self.get_cell(old_position) == self.get_cell(position):
+            self.positions[item] = position
+        else:
+            self.insert(item, position)
+
+    def clear(self):
+        self.cells = dict()
+        self.positions = dict()
+
+    def get_position(self, item):
+        return self.positions.get(item)
+
+    @staticmethod
+    def get_distance(a, b):
+        x = a[0] - b[0]
+        y = a[1] - b[1]
+        return math.sqrt(x * x + y * y)
+
+    def _cells_in_rect(self, x_min, y_min, x_max, y_max):
+        c_x_min, c_y_min = self.get_cell((x_min, y_min))
+        c_x_max, c_y_max = self.get_cell((x_max, y_max))
+        if (c_x_max - c_x_min + 1) * (c_y_max - c_y_min + 1) > len(self.cells):
+            # The rectangle spans more cells than are occupied, visit the occupied ones instead
+            for (cx, cy), items in self.cells.items():
+                if c_x_min <= cx <= c_x_max and c_y_min <= cy <= c_y_max:
+                    yield items
+            return
+        for cx in range(c_x_min, c_x_max + 1):
+            for cy in range(c_y_min, c_y_max + 1):
+                items = self.cells.get((cx, cy))
+                if items:
+                    yield items
+
+    def query_rect(self, x_min, y_min, x_max, y_max):
+        hits = []
+        for items in self._cells_in_rect(x_min, y_min, x_max, y_max):
+            for item in items:
+                x, y = self.positions[item]
+                if x_min <= x <= x_max and y_min <= y <= y_max:
+                    hits.append(item)
+        return hits
+
+    def query_radius(self, position, radius, inclusive=False):
+        # Items closer than radius to position, or at most radius away if inclusive
+        x, y = position
+        hits = []
+        for items in self._cells_in_rect(x - radius, y - radius, x + radius, y + radius):
+            for item in items:
+                distance = self.get_distance(self.positions[item], position)
+                if distance < radius or (inclusive and distance == radius):
+                    hits.append(item)
+        return hits
+
+    def query_point(self, position, max_radius, radius_function=None):
+        # Nearest item closer to position than its own radius, radius_function(item), or max_radius
+        hits = [(self.get_distance(self.positions[item], position), item)
+                for item in self.query_radius(position, max_radius)]
+        if radius_function:
+            hits = [(distance, item) for distance, item in hits if distance < radius_function(item)]
+        return min(hits, key=lambda hit: hit[0])[1] if hits else None
+
+    def nearest(self, position, k=1, item_filter=None):
+        # Up to k items sorted by distance to position, skipping items for which item_filter returns False
+        if not self.cells or k <= 0:
+            return []
+        cx, cy = self.get_cell(position)
+        occupied = self.cells.keys()
+        max_ring = max(max(abs(cell_x - cx), abs(cell_y - cy)) for cell_x, cell_y in occupied)
+        hits = []
+        if (2 * max_ring + 1) ** 2 > 4 * len(self.cells):
+            # Sparse or far away items, the rings would mostly visit empty cells
+            hits = [(self.get_distance(item_position, position), item) for item, item_position in self.positions.items()
+                    if item_filter is None or item_filter(item)]
+            hits.sort(key=lambda hit: hit[0])
+            return [item for distance, item in hits[:k]]
+        for ring in range(max_ring + 1):
+            for cell in self._ring_cells(cx, cy, ring):
+                for item in self.cells.get(cell, ()):
+                    if item_filter is None or item_filter(item):
+                        hits.append((self.get_distance(self.positions[item], position), item))
+            # Every item not visited yet is at least ring cells away from position
+            if len(hits) >= k:
+                hits.sort(key=lambda hit: hit[0])
+                if hits[k - 1][0] <= ring * self.cell_size:
+                    break
+        hits.sort(key=lambda hit: hit[0])
+        return [item for distance, item in hits[:k]]
+
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class Heightmap:
+    # Altitude map decoded once from an image into a NumPy array of altitudes.
+    # Dark pixels are high: altitude = (max - min) * (1 - red/255) + min, as the old per-pixel lookup did.
+    # Positions are pixel coordinates with the origin in the lower left corner, like pyglet's image data.
+    def __init__(self, image, min_altitude, max_altitude, bilinear=True):
+        pformat = 'RGBA'
+        image_data = image.get_image_data()
+        pitch = image_data.width * len(pformat)
+        data = image_data.get_data(pformat, pitch)
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(image_data.height, image_data.width, len(pformat))
+        self.width = image_data.width
+        self.height = image_data.height
+        self.min_altitude = min_altitude
+        self.max_altitude = max_altitude
+        self.bilinear = bilinear
+        self.altitudes = (max_altitude - min_altitude) * (1 - pixels[:, :, 0] / 255.0) + min_altitude
+
+    def sample(self, xs, ys, bilinear=None):
+        # Altitudes at arrays of x and y positions. Positions outside the image are clamped to its border.
+        bilinear = self.bilinear if bilinear is None else bilinear
+        xs = np.clip(np.asarray(xs, dtype=np.float64), 0, self.width - 1)
+        ys = np.clip(np.asarray(ys, dtype=np.float64), 0, self.height - 1)
+        if not bilinear:
+            return self.altitudes[ys.astype(np.int64), xs.astype(np.int64)]
+        x0 = np.minimum(np.floor(xs).astype(np.int64), self.width - 2) if self.width > 1 else np.zeros_like(xs, np.int64)
+        y0 = np.minimum(np.floor(ys).astype(np.int64), self.height - 2) if self.height > 1 else np.zeros_like(ys, np.int64)
+        x1 = np.minimum(x0 + 1, self.width - 1)
+        y1 = np.minimum(y0 + 1, self.height - 1)
+        fx = xs - x0
+        fy = ys - y0
+        a = self.altitudes
+        bottom = a[y0, x0] * (1 - fx) + a[y0, x1] * fx
+        top = a[y1, x0] * (1 - fx) + a[y1, x1] * fx
+        return bottom * (1 - fy) + top * fy
+
+    def get_altitude(self, position, bilinear=None):
+        x, y = position
+        return float(self.sample(x, y, bilinear))
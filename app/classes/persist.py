@@ -1,33 +1,134 @@
 import persistent
 import transaction
 import ZODB
+import math
 import os
 
+import numpy as np
+from BTrees.OOBTree import OOBTree
+
 from app.config import config
+from app.classes.graph.node import Node
+
+
+class PersistentObject(persistent.Persistent):
+    @staticmethod
+    def commit_transaction():
+        transaction.commit()
+
+
+class PersistentGraph(PersistentObject):
+    # Plain-data snapshot of a NavigationGraph. Nodes are referred to by their index in the arrays, so a record
+    # holds no Node, Edge or pyglet objects and loads into graphs with and without visuals alike.
+    def __init__(self, nav_graph, name=None, n_rows=None, n_cols=None):
+        nodes = nav_graph.graph.nodes()
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = nav_graph.graph.edges(data=True)
+        pathfinder = nav_graph.pathfinder
+        self.name = name
+        self.positions = np.array([node.get_position() for node in nodes], dtype=np.float64).reshape(-1, 2)
+        self.altitudes = np.array([node.altitude for node in nodes], dtype=np.float64)
+        self.labels = [node.label for node in nodes]
+        self.blocked = [i for i, node in enumerate(nodes) if node.has_occupants()]
+        self.edges = np.array([(index[u], index[v]) for u, v, data in edges], dtype=np.int64).reshape(-1, 2)
+        self.weights = np.array([data[config.strings.weight] for u, v, data in edges], dtype=np.float64)
+        self.start = index.get(pathfinder.start_node)
+        self.destination = index.get(pathfinder.destination_node)
+        self.waypoints = [index[node] for node in pathfinder.waypoints if node in index]
+        # Grid size for the walk statistics of ConsoleView, guessed from the node count if not known
+        if n_rows is None:
+            n_rows = max(1, int(math.sqrt(len(nodes))))
+        if n_cols is None:
+            n_cols = max(1, int(math.ceil(len(nodes) / n_rows)))
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+
+    def get_node_count(self):
+        return len(self.positions)
+
+    def create_nodes(self):
+        nodes = []
+        for (x, y), altitude, label in zip(self.positions.tolist(), self.altitudes.tolist(), self.labels):
+            node = Node(x, y, altitude=altitude)
+            node.set_label(label)
+            nodes.append(node)
+        for i in self.blocked:
+            nodes[i].add_occupant(True)
+        return nodes
 
+    def load_into(self, nav_graph):
+        # Replaces the content of nav_graph in one bulk insert and returns the new nodes in stored order
+        nav_graph.clear()
+        nodes = self.create_nodes()
+        weighted_edges = [(nodes[u], nodes[v], weight)
+                          for (u, v), weight in zip(self.edges.tolist(), self.weights.tolist())]
+        nav_graph.insert_graph(nodes, weighted_edges)
+        self.restore_path(nav_graph, nodes)
+        return nodes
 
-class PersistentNodeCollection:
-    # ToDO: Prepare nodes to be stored, or prepare nodes after loaded.
-    pass
+    def restore_path(self, nav_graph, nodes):
+        # Start, destination and waypoints, e.g. again after walks moved the start node
+        pathfinder = nav_graph.pathfinder
+        pathfinder.waypoints.clear()
+        if self.start is not None and nodes[self.start] is not pathfinder.start_node:
+            nav_graph.set_start_node(nodes[self.start])
+        if self.destination is not None and nodes[self.destination] is not pathfinder.destination_node:
+            nav_graph.set_destination_node(nodes[self.destination])
+        for i in self.waypoints:
+            pathfinder.add_waypoint(nodes[i])
+        pathfinder.update_to_new_path()
 
 
 class PersistentStorage:
+    # The database is opened on first use, so importing this module does not lock the file,
+    # e.g. in the worker processes of a console sweep
     def __init__(self):
+        self.db = None
+        self.connection = None
+        self._root = None
+
+    def open(self):
         db_path = config.settings_path
         if not os.path.exists(db_path):
             os.makedirs(db_path)
         zodb_filename = os.path.join(db_path, config.strings.zodb_filename)
         self.db = ZODB.DB(zodb_filename)
         self.connection = self.db.open()
-        self.root = self.connection.root()
+        self._root = self.connection.root()
+
+    @property
+    def root(self):
+        if self._root is None:
+            self.open()
+        return self._root
 
     def commit(self):
         transaction.commit()
 
-persistent_storage = PersistentStorage()
+    def get_graphs(self):
+        key = config.strings.zodb_graphs_key
+        if key not in self.root:
+            self.root[key] = OOBTree()
+            self.commit()
+        return self.root[key]
 
+    def get_graph_names(self):
+        return list(self.get_graphs().keys())
 
-class PersistentObject(persistent.Persistent):
-    @staticmethod
-    def commit_transaction():
-        transaction.commit()
+    def get_graph(self, name):
+        return self.get_graphs().get(name)
+
+    def save_graph(self, name, nav_graph, n_rows=None, n_cols=None):
+        record = PersistentGraph(nav_graph, name, n_rows, n_cols)
+        self.get_graphs()[name] = record
+        self.commit()
+        return record
+
+    def load_graph(self, name, nav_graph):
+        # Returns the loaded nodes, or None if no graph is saved by that name
+        record = self.get_graph(name)
+        if record is None:
+            return None
+        return record.load_into(nav_graph)
+
+persistent_storage = PersistentStorage()
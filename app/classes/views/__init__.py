@@ -1,6 +1,7 @@
 import math
+import os
 import sys
-import csv
+from functools import partial
 from itertools import count
 
 
@@ -13,13 +14,14 @@ class View:
 
 
 import pyglet
-from app.classes.windows.main_window import MainWindow
-from app.classes.windows.test_window import TestWindow
 
 
 class PygletWindowView(View):
     def __init__(self):
         super().__init__("Pyglet window view")
+        # Imported here, the windows need a display that console runs may not have
+        from app.classes.windows.main_window import MainWindow
+        from app.classes.windows.test_window import TestWindow
         if config.test:
             self.window = TestWindow()
         else:
@@ -32,12 +34,18 @@ class PygletWindowView(View):
 
 
 from app.config import config, seeded_random as random
+from app.classes.views.parallel_sweep import ParallelSweepRunner
+from app.classes.views.walk_simulator import WalkSimulator
+from app.classes.views.walk_statistics import WalkStatistics
 from app.pythomas import pythomas as lib
 from app.classes.graph.navigation_graph import NavigationGraph, Node
+from app.classes.graph.dstar_lite_pathfinder import DStarLitePathfinder
+from app.classes.graph.pathfinder import ContractionHierarchyPathfinder
 from app.classes.graph.analyzer import Analyzer
 from app.classes.graph.agent import GoodAgent
+from app.classes.persist import persistent_storage
 from pymongo import MongoClient
-import copy
+import numpy as np
 
 
 class WalkDataKey:
@@ -71,46 +79,93 @@ class ConsoleView(View):
         success = 'success'
         retreat = 'retreat'
 
-    def __init__(self):
+    def __init__(self, graph_record=None, use_contraction_hierarchy=False):
         super().__init__("Console View")
         self.nav_graph = NavigationGraph()
         self.nav_graph.set_no_visuals(no_visuals=True)
+        # Walks re-set the start node at every retreat, so keep the search state between replans.
+        # The topology of a grid never changes during its walks, so a contraction hierarchy can answer them instead.
+        # Its paths cost the same, but on flat grids it may pick other routes of equal cost, so results of sweeps
+        # in the two modes are comparable only in distribution.
+        self.use_contraction_hierarchy = use_contraction_hierarchy
+        pathfinder_class = ContractionHierarchyPathfinder if use_contraction_hierarchy else DStarLitePathfinder
+        self.nav_graph.set_pathfinder(pathfinder_class(self.nav_graph.graph, self.nav_graph.altitude_function,
+                                                       self.nav_graph.compact_graph))
         self.running = True
         self.client = MongoClient()
         self.db = self.client.pretreat
         self.strings = self.Strings
         self.walk_data_key = WalkDataKey()
-        self.walk_keys = []
         # print('Collections: \n'.format(self.db.collection_names(include_system_collections=False)))
 
-        self.stats = dict()
+        self.results_filename = 'console_view_results.csv'
+        self.save_columnar = False  # Also write the results as one array per column to an .npz file
+        self.stats = WalkStatistics(filename=self.results_filename)
+        self.show_progress = True
+        # Sweep work units are spread over this many processes, 1 runs them in this process
+        self.processes = None
+        self.n_runs = 1000
+        # Simulate all walks of a unit at once with WalkSimulator instead of one perform_walk at a time
+        self.vectorized = False
+        # Name of a graph saved from the window, e.g. with Ctrl+M, to walk instead of generated grids
+        self.graph_name = None
+        self.graph_record = graph_record
+        self.record_nodes = None    # Nodes of graph_record once it is loaded into nav_graph
 
     def run(self):
         print("Starting {}".format(self.name))
+        if self.graph_name:
+            self.run_saved_graph()
+            return
         n_rows_min, n_cols_min = 5, 5
         n_rows_max, n_cols_max = 20, 20
         rows_iter = [i for i in range(n_rows_min, n_rows_max, 3)]
         cols_iter = [i for i in range(n_cols_min, n_cols_max, 3)]
-        row_i = -1
-        for n_rows in rows_iter:
-            row_i += 1
-            self.walk_data_key.n_rows = n_rows
-            col_i = -1
-            for n_cols in cols_iter:
-                col_i += 1
-
-                def get_progress():
-                    row_ratio = row_i/len(rows_iter)
-                    col_ratio = col_i/len(cols_iter)
-                    ratio_per_row = 1 / len(rows_iter)
-                    ratio_per_col = 1 / len(cols_iter) * ratio_per_row
-                    return row_ratio + col_ratio * ratio_per_row, ratio_per_col
-                self.walk_data_key.n_cols = n_cols
-                self.run_repeated_walks(n_rows, n_cols, get_progress)
+        runner = ParallelSweepRunner(rows_iter, cols_iter, self.n_runs, processes=self.processes)
+        runner.run(self, view_factory=self.get_view_factory())
+        self.save_results()
+
+    def get_view_factory(self, graph_record=None):
+        # Builds the views of the worker processes with the options that are set in __init__
+        return partial(ConsoleView, graph_record=graph_record, use_contraction_hierarchy=self.use_contraction_hierarchy)
+
+    def run_saved_graph(self):
+        # Sweeps the walks over one saved graph. The record is read here and handed to the workers,
+        # so only this process opens the database.
+        self.graph_record = persistent_storage.get_graph(self.graph_name)
+        if self.graph_record is None:
+            print("{}No graph called '{}'.".format(config.strings.error_prefix, self.graph_name))
+            return
+        record = self.graph_record
+        runner = ParallelSweepRunner([record.n_rows], [record.n_cols], self.n_runs, processes=self.processes)
+        runner.run(self, view_factory=self.get_view_factory(graph_record=record))
         self.save_results()
 
-    def run_repeated_walks(self, n_rows, n_cols, get_progress):
-        path_nodes = self.create_until_path(n_rows, n_cols)
+    def run_sweep_unit(self, unit):
+        # Runs one ParallelSweepRunner unit and returns its counts without touching this view's totals
+        stats = self.stats
+        self.stats = WalkStatistics()
+        try:
+            self.walk_data_key.n_rows = unit.n_rows
+            self.walk_data_key.n_cols = unit.n_cols
+            random.seed(unit.grid_seed)
+            if self.graph_record:
+                path_nodes = self.create_from_record()
+            else:
+                path_nodes = self.create_until_path(unit.n_rows, unit.n_cols)
+            random.seed(unit.walk_seed)
+            self.run_repeated_walks(path_nodes, unit.walk_indices)
+            return self.stats.counts
+        finally:
+            self.stats = stats
+
+    def merge_results(self, counts):
+        self.stats.merge(counts)
+
+    def run_repeated_walks(self, path_nodes, walk_indices):
+        if self.vectorized:
+            self.simulate_repeated_walks(path_nodes, len(walk_indices))
+            return
         nodes = self.nav_graph.graph.nodes()
         self.walk_data_key.path_len = len(path_nodes)
 
@@ -119,15 +174,11 @@ class ConsoleView(View):
             waypoint = nodes[int(len(nodes)/2)]
             self.nav_graph.pathfinder.add_waypoint(waypoint)
 
-        n_runs = 1000
-        for walk_i in range(0, n_runs):
-            progress, ratio_per_batch = get_progress()
-            progress += walk_i / n_runs * ratio_per_batch
-            self.print_progress(progress, 'Walking{}'.format(' .'*int(10*walk_i/n_runs)))
+        for walk_i in walk_indices:
             self.walk_data_key.walk_i = walk_i
             self.walk_incremental_evils(path_nodes)
 
-    def walk_incremental_evils(self, path_nodes):
+    def get_evil_counts(self):
         n_evil_steps = 10
         min_evils = 2
         max_evils = self.get_n_evils_so(p_walk_ok=0.5) + 1
@@ -136,12 +187,32 @@ class ConsoleView(View):
             max_evils = min_evils + n_evil_steps
         step = int((max_evils - min_evils) / n_evil_steps)
         step = step if step >= 1 else 1
+        return range(min_evils, max_evils, step)
+
+    def walk_incremental_evils(self, path_nodes):
         nodes = self.nav_graph.graph.nodes()
-        for n_evils in range(min_evils, max_evils, step):
+        for n_evils in self.get_evil_counts():
             self.walk_data_key.n_evils = n_evils
             # n_evils = min_evils + (max_evils-min_evils) * int(walk_i/n_runs)
             self.perform_walk(nodes, path_nodes, n_evils)
 
+    def simulate_repeated_walks(self, path_nodes, n_walks):
+        def route_function(node):
+            self.nav_graph.set_start_node(node)
+            self.nav_graph.pathfinder.update_to_new_path()
+            return list(self.nav_graph.pathfinder.get_path_nodes())
+
+        simulator = WalkSimulator(self.nav_graph.graph.nodes(), self.nav_graph.neighbors_of, path_nodes, route_function)
+        random_state = np.random.RandomState(random.getrandbits(32))
+        for n_evils in self.get_evil_counts():
+            self.walk_data_key.n_evils = n_evils
+            for outcome in simulator.simulate(n_evils, n_walks, random_state):
+                self.walk_data_key.path_i = outcome.path_i
+                self.walk_data_key.path_len = outcome.path_len
+                self.walk_data_key.success = outcome.success
+                self.walk_data_key.death = outcome.death
+                self.increment_stats_for_walk_data(outcome.count)
+
     def perform_walk(self, nodes, initial_path, n_evils):
         # print('Path: {}'.format(path_nodes))
 
@@ -152,16 +223,16 @@ class ConsoleView(View):
         n_previous_steps = 0
         while True:
             path = path if path else initial_path
+            self.walk_data_key.path_len = len(initial_path) + n_previous_steps
             complete = self.follow_path(path, evils)
             if complete:
-                self.walk_data_key.path_len += n_previous_steps
                 return
             path_i = self.walk_data_key.path_i
             current_node = path[path_i]
             n_previous_steps += path_i
             self.nav_graph.set_start_node(current_node)
             self.nav_graph.pathfinder.update_to_new_path()
-            path = self.nav_graph.pathfinder.get_path_nodes()
+            path = list(self.nav_graph.pathfinder.get_path_nodes())
 
     def follow_path(self, path_nodes, evils):
         # Iterate path nodes, returns True if complete, False if evil detected
@@ -174,11 +245,12 @@ class ConsoleView(View):
                 self.walk_collide()
                 return True
             next_node = path_nodes[path_i+1] if path_i < len(path_nodes)-1 else None
-            if any(evil is next_node for evil in evils):
-                return False
-            # Update the new positions
+            # Update the new positions. Also when retreating, otherwise the replanned path meets the same evil forever.
+            blocked = any(evil is next_node for evil in evils)
             evils.clear()
             evils.extend(moved_evils)
+            if blocked:
+                return False
         self.walk_success()
         return True
 
@@ -192,16 +264,10 @@ class ConsoleView(View):
         self.increment_stats_for_walk_data()
         # print(" >> {} - Died on {}".format(walk_i, node))
 
-    def increment_stats_for_walk_data(self):
+    def increment_stats_for_walk_data(self, walk_count=1):
         if not self.walk_data_key.complete():
             raise AttributeError('The key object does not describe a completed walk.')
-        key = self.walk_data_key.key()
-        try:
-            self.stats[key] += 1
-        except KeyError:
-            self.stats[key] = 1
-        # Save key
-        self.walk_keys.append(copy.copy(self.walk_data_key))
+        self.stats.add(self.walk_data_key, walk_count)
         # Reset flags
         self.walk_data_key.death = False
         self.walk_data_key.success = False
@@ -219,35 +285,20 @@ class ConsoleView(View):
         return new_evils
 
     def print_progress(self, ratio, text):
+        if not self.show_progress:
+            return
         sys.stdout.write("\rProgress: {:.3f}% - {}".format(ratio*100, text))
         sys.stdout.flush()
 
     def save_results(self):
-        used_keys = []
-        # print('\n\tRows \tCols \tDistance \tPathLen \tSuccess \tDeath \tCount')
-        with open('console_view_results.csv', 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['sep=,'])
-            writer.writerow('\n\tRows \tCols \tDistance \tnEvils \tPathLen \tSuccess \tDeath \tCount'.split())
-            ki = -1
-            for walk_key in self.walk_keys:
-                ki += 1
-                key = walk_key.key()
-                r_count = self.stats[key]
-                if key not in used_keys:
-                    line = walk_key.csv_line()
-                    line.append(r_count)
-                    writer.writerow(line)
-                    # print('\t{}\t{}'.format(walk_key, count))
-                self.print_progress(ki / len(self.walk_keys), 'Saving to file..')
-                used_keys.append(key)
-
-        keys = [key.key() for key in self.walk_keys]
-        if any(key not in keys for key in self.stats.keys()):
-            raise Exception('Something is very wrong.')
+        self.print_progress(1, 'Saving {} keys to file..'.format(len(self.stats)))
+        self.stats.write_csv(self.results_filename)
+        if self.save_columnar:
+            self.stats.write_columnar(os.path.splitext(self.results_filename)[0] + '.npz')
 
     def generate_new_grid(self, n_rows, n_cols):
-        print('New grid: {} x {}'.format(n_rows, n_cols))
+        if self.show_progress:
+            print('New grid: {} x {}'.format(n_rows, n_cols))
         self.nav_graph.generate_viewless_grid(n_rows, n_cols, make_hex=False)
 
     def create_until_path(self, n_rows, n_cols):
@@ -257,7 +308,20 @@ class ConsoleView(View):
             self.nav_graph.clear()
             self.generate_new_grid(n_rows, n_cols)
             self.create_new_path()
-            path_nodes = self.nav_graph.pathfinder.get_path_nodes()
+            # A copy, moving the start node clears the node list of the pathfinder's path
+            path_nodes = list(self.nav_graph.pathfinder.get_path_nodes())
+        return path_nodes
+
+    def create_from_record(self):
+        # The saved graph is loaded once per process, later units only restore its path
+        if self.record_nodes is None:
+            self.record_nodes = self.graph_record.load_into(self.nav_graph)
+        else:
+            self.graph_record.restore_path(self.nav_graph, self.record_nodes)
+        path_nodes = list(self.nav_graph.pathfinder.get_path_nodes())
+        if not path_nodes:
+            # Saved without a path
+            path_nodes = list(self.create_new_path())
         return path_nodes
 
     def create_new_path(self):
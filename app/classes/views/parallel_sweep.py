@@ -0,0 +1,86 @@
+import multiprocessing
+import random as original_random
+
+from app.config import config
+
+
+def derive_seed(*key):
+    # Deterministic child seed, independent of process and hash randomization:
+    # random.Random hashes str seeds with SHA-512.
+    return original_random.Random('-'.join(str(part) for part in key)).getrandbits(64)
+
+
+class SweepUnit:
+    # One work unit of a sweep: a batch of walks on one grid size.
+    # The grid is seeded by its size only, so every batch of the same size walks the same graph and path.
+    def __init__(self, n_rows, n_cols, batch_i, walk_indices, base_seed):
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.batch_i = batch_i
+        self.walk_indices = walk_indices
+        self.grid_seed = derive_seed(base_seed, n_rows, n_cols)
+        self.walk_seed = derive_seed(base_seed, n_rows, n_cols, batch_i)
+
+    def __repr__(self):
+        return "{} {}x{} #{}".format(self.__class__.__name__, self.n_rows, self.n_cols, self.batch_i)
+
+
+_worker_view = None
+
+
+def _init_worker(view_factory):
+    global _worker_view
+    _worker_view = view_factory()
+    _worker_view.show_progress = False
+
+
+def _run_unit(unit):
+    return _worker_view.run_sweep_unit(unit)
+
+
+class ParallelSweepRunner:
+    # Spreads (n_rows, n_cols, walk batch) units over a process pool and merges the results in unit order.
+    # Every unit reseeds the shared seeded_random with its own child seed, so the merged output only
+    # depends on base_seed, not on the number of processes. processes=1 runs the same units in-process.
+    def __init__(self, rows_iter, cols_iter, n_runs, batch_size=250, processes=None,
+                 base_seed=config.world.default_rand_seed):
+        self.rows_iter = rows_iter
+        self.cols_iter = cols_iter
+        self.n_runs = n_runs
+        self.batch_size = max(1, batch_size)
+        self.processes = processes if processes else multiprocessing.cpu_count()
+        self.base_seed = base_seed
+
+    def get_units(self):
+        units = []
+        for n_rows in self.rows_iter:
+            for n_cols in self.cols_iter:
+                batch_i = 0
+                for walk_start in range(0, self.n_runs, self.batch_size):
+                    walk_indices = range(walk_start, min(walk_start + self.batch_size, self.n_runs))
+                    units.append(SweepUnit(n_rows, n_cols, batch_i, walk_indices, self.base_seed))
+                    batch_i += 1
+        return units
+
+    def run(self, view, view_factory=None):
+        # view receives the merged results; view_factory builds one view per worker process
+        units = self.get_units()
+        if self.processes <= 1 or len(units) <= 1:
+            results = (view.run_sweep_unit(unit) for unit in units)
+            self._merge(view, units, results)
+            return
+        view_factory = view_factory if view_factory else view.__class__
+        pool = multiprocessing.Pool(self.processes, initializer=_init_worker, initargs=(view_factory,))
+        try:
+            self._merge(view, units, pool.imap(_run_unit, units))
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _merge(view, units, results):
+        unit_i = 0
+        for result in results:
+            view.merge_results(result)
+            unit_i += 1
+            view.print_progress(unit_i / len(units), 'Walked {}'.format(units[unit_i-1]))
@@ -0,0 +1,152 @@
+import numpy as np
+
+
+class WalkOutcome:
+    def __init__(self, path_i, path_len, success, death, count):
+        self.path_i = path_i
+        self.path_len = path_len
+        self.success = success
+        self.death = death
+        self.count = count
+
+    def __repr__(self):
+        return "{} path_i={} path_len={} success={} death={} x{}".format(
+            self.__class__.__name__, self.path_i, self.path_len, self.success, self.death, self.count)
+
+
+class WalkSimulator:
+    # Batched version of ConsoleView.perform_walk: runs many independent walks at once with the evil
+    # positions of all walks in one (walks x evils) integer array, and neighbor sampling done through a
+    # padded adjacency matrix. Each tick follows follow_path/move_evils:
+    #   - every evil proposes a move to a random neighbor that is not held by an evil yet to move, or stays,
+    #   - an evil on the walker's node (before moving) kills it,
+    #   - an evil on the next path node makes the walker hold its node and replan from there,
+    #   - otherwise the walker steps forward, succeeding past the last node.
+    # The proposed moves are applied for every walker still alive.
+    # Replanned paths are looked up in a route table built once with route_function(node).
+    memory_budget = 64 * 1024 * 1024    # Bytes for the per-batch evil occupancy table
+
+    def __init__(self, nodes, neighbors_function, initial_path, route_function, batch_size=8192, max_ticks=None):
+        self.nodes = list(nodes)
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        node_count = len(self.nodes)
+        self.batch_size = max(1, min(batch_size, self.memory_budget // (2 * max(1, node_count))))
+        self.max_ticks = max_ticks if max_ticks else 1000 * node_count
+
+        neighbor_lists = [[self.node_ids[neighbor] for neighbor in neighbors_function(node)] for node in self.nodes]
+        max_degree = max([len(neighbors) for neighbors in neighbor_lists] + [1])
+        self.neighbors = np.full((node_count, max_degree), -1, dtype=np.int64)
+        for node_id, neighbors in enumerate(neighbor_lists):
+            self.neighbors[node_id, :len(neighbors)] = neighbors
+
+        self.initial_path = list(initial_path)
+        self.start_id = self.node_ids[self.initial_path[0]]
+        self._build_routes(route_function)
+
+    def _build_routes(self, route_function):
+        # Route 0 is the initial path. Every node a walker can retreat from gets the route replanned from it.
+        routes = [[self.node_ids[node] for node in self.initial_path]]
+        route_of = {routes[0][0]: 0}
+        route_i = 0
+        while route_i < len(routes):
+            for node_id in routes[route_i][:-1]:
+                if node_id in route_of:
+                    continue
+                route = route_function(self.nodes[node_id])
+                if route:
+                    route_of[node_id] = len(routes)
+                    routes.append([self.node_ids[node] for node in route])
+                else:
+                    route_of[node_id] = 0   # perform_walk falls back to the initial path
+            route_i += 1
+
+        self.route_lengths = np.array([len(route) for route in routes], dtype=np.int64)
+        self.routes = np.full((len(routes), int(self.route_lengths.max()) + 1), -1, dtype=np.int64)
+        for i, route in enumerate(routes):
+            self.routes[i, :len(route)] = route
+        self.route_of = np.zeros(len(self.nodes), dtype=np.int64)
+        for node_id, i in route_of.items():
+            self.route_of[node_id] = i
+
+    def place_evils(self, n_evils, n_walks, random_state):
+        if n_evils > len(self.nodes) - 1:
+            raise ValueError("Sample larger than population")
+        keys = random_state.random_sample((n_walks, len(self.nodes)))
+        keys[:, self.start_id] = 2.0
+        return np.argsort(keys, axis=1)[:, :n_evils]
+
+    def move_evils(self, positions, random_state):
+        n_walks, n_evils = positions.shape
+        rows = np.arange(n_walks)
+        # Evils not yet moved in this tick, counted per node. Evil e only avoids the old positions of evils e..n-1.
+        waiting = np.zeros((n_walks, len(self.nodes)), dtype=np.int16)
+        np.add.at(waiting, (np.repeat(rows, n_evils), positions.ravel()), 1)
+        moved = positions.copy()
+        for e in range(n_evils):
+            current = positions[:, e]
+            candidates = self.neighbors[current]
+            available = (candidates >= 0) & (waiting[rows[:, None], np.maximum(candidates, 0)] == 0)
+            n_available = available.sum(axis=1)
+            choice = (random_state.random_sample(n_walks) * (n_available + 1)).astype(np.int64)
+            picked = available & (np.cumsum(available, axis=1) == (choice + 1)[:, None])
+            moves = choice < n_available
+            moved[:, e] = np.where(moves, candidates[rows, picked.argmax(axis=1)], current)
+            waiting[rows, current] -= 1
+        return moved
+
+    def simulate(self, n_evils, n_walks, random_state):
+        # Returns a list of WalkOutcome with the number of walks ending in each (path_i, path_len, success, death)
+        counts = dict()
+        for batch_start in range(0, n_walks, self.batch_size):
+            batch_walks = min(self.batch_size, n_walks - batch_start)
+            self._simulate_batch(n_evils, batch_walks, random_state, counts)
+        return [WalkOutcome(path_i, path_len, success, death, count)
+                for (path_i, path_len, success, death), count in counts.items()]
+
+    def _simulate_batch(self, n_evils, n_walks, random_state, counts):
+        positions = self.place_evils(n_evils, n_walks, random_state)
+        route = np.zeros(n_walks, dtype=np.int64)
+        index = np.zeros(n_walks, dtype=np.int64)
+        previous_steps = np.zeros(n_walks, dtype=np.int64)
+        active = np.arange(n_walks)
+        base_len = len(self.initial_path)
+
+        def record(walks, success):
+            # Count (path_i, path_len) pairs packed into one integer, path_i < routes.shape[1]
+            width = self.routes.shape[1]
+            packed = (base_len + previous_steps[walks]) * width + index[walks]
+            keys, key_counts = np.unique(packed, return_counts=True)
+            for packed_key, count in zip(keys.tolist(), key_counts.tolist()):
+                key = (packed_key % width, packed_key // width, success, not success)
+                counts[key] = counts.get(key, 0) + count
+
+        ticks = 0
+        while active.size and ticks < self.max_ticks:
+            ticks += 1
+            walk_route, walk_index = route[active], index[active]
+            walk_positions = positions[active]
+            agent = self.routes[walk_route, walk_index]
+            has_next = walk_index + 1 < self.route_lengths[walk_route]
+            next_node = np.where(has_next, self.routes[walk_route, walk_index + 1], -1)
+
+            dead = (walk_positions == agent[:, None]).any(axis=1)
+            blocked = ~dead & (walk_positions == next_node[:, None]).any(axis=1)
+            advancing = ~dead & ~blocked
+
+            if dead.any():
+                record(active[dead], success=False)
+
+            retreating = active[blocked]
+            previous_steps[retreating] += index[retreating]
+            route[retreating] = self.route_of[agent[blocked]]
+            index[retreating] = 0
+
+            alive = ~dead
+            if alive.any():
+                positions[active[alive]] = self.move_evils(walk_positions[alive], random_state)
+            arrived = advancing & ~has_next
+            if arrived.any():
+                record(active[arrived], success=True)
+            index[active[advancing & has_next]] += 1
+
+            active = active[blocked | (advancing & has_next)]
@@ -0,0 +1,78 @@
+import csv
+import os
+import time
+
+import numpy as np
+
+
+class WalkStatistics:
+    # Streaming walk counter for ConsoleView. Walks are counted into a table keyed by
+    # WalkDataKey.csv_line() while they run, so memory is bounded by the number of distinct keys,
+    # and the results are written in one pass over that table. With a filename set, partial
+    # results are flushed to it every flush_interval seconds.
+    header = ['Rows', 'Cols', 'Distance', 'nEvils', 'PathLen', 'Success', 'Death', 'Count']
+
+    def __init__(self, filename=None, flush_interval=60.0):
+        self.counts = dict()
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self._last_flush = time.time()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get_walk_count(self):
+        return sum(self.counts.values())
+
+    def add(self, walk_data_key, walk_count=1):
+        key = tuple(walk_data_key.csv_line())
+        self.counts[key] = self.counts.get(key, 0) + walk_count
+        self._flush_if_due()
+
+    def merge(self, counts):
+        for key, walk_count in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + walk_count
+        self._flush_if_due()
+
+    def clear(self):
+        self.counts = dict()
+
+    def _flush_if_due(self):
+        if self.filename and time.time() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.filename:
+            self.write_csv(self.filename)
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _replace(filename, write_function):
+        # Write to a temporary file first, so an interrupted flush never leaves a truncated result file
+        temporary_filename = filename + '.tmp'
+        write_function(temporary_filename)
+        os.replace(temporary_filename, filename)
+
+    def write_csv(self, filename):
+        def write(path):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['sep=,'])
+                writer.writerow(self.header)
+                for key, walk_count in self.counts.items():
+                    writer.writerow(list(key) + [walk_count])
+        self._replace(filename, write)
+
+    def write_columnar(self, filename):
+        # One NumPy array per column in an .npz file, e.g. for loading straight into pandas or numpy
+        columns = list(zip(*self.counts.keys())) if self.counts else [()] * (len(self.header) - 1)
+        arrays = dict()
+        for name, column in zip(self.header, columns):
+            dtype = np.bool_ if name in ('Success', 'Death') else np.int64
+            arrays[name] = np.array(column, dtype=dtype)
+        arrays['Count'] = np.array(list(self.counts.values()), dtype=np.int64)
+
+        def write(path):
+            with open(path, 'wb') as f:
+                np.savez(f, **arrays)
+        self._replace(filename, write)
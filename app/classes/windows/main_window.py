@@ -4,6 +4,8 @@ from app.config import config
 from app.pythomas import pythomas as lib
 from app.pythomas.pythomas import PygletLib as Plib
 from app.classes.windows.base_window import BaseWindow
+from app.classes.camera import Camera
+from app.classes.persist import persistent_storage
 from app.classes.graph.navigation_graph import NavigationGraph, Node
 from app.classes.graph.analyzer import Analyzer
 from app.classes.graph.agent import GoodAgent
@@ -24,6 +26,8 @@ class MainWindow(BaseWindow):
             self.window.set_size(config.window.default_width, config.window.default_height)
         self.draw_background = True
         self.accumulated_scroll_y = 0.0
+        # Mouse events are in screen coordinates and are converted to world coordinates by the camera
+        self.camera = Camera(self.window.width, self.window.height)
 
         # Dragging of nodes:
         self.dragged_nodes = None
@@ -39,12 +43,15 @@ class MainWindow(BaseWindow):
 
     def on_draw(self):
         self.window.clear()
+        self.camera.begin()
         if self.draw_background:
             self.background_image.blit(0, 0)
 
         def draw_graph():
+            self.nav_graph.set_view(self.camera.get_view_rect(), self.camera.zoom)
             self.nav_graph.draw()
         draw_graph()
+        self.camera.end()
 
     def draw_graph_grid(self):
         start_label = destination_label = None
@@ -61,6 +68,21 @@ class MainWindow(BaseWindow):
             if destination_label and node.label == destination_label:
                 self.nav_graph.set_destination_node(node)
 
+    def save_graph(self):
+        name = input("What should I call the current graph? ")
+        if not name:
+            return
+        record = persistent_storage.save_graph(name, self.nav_graph)
+        print("Saved '{}' with {} nodes.".format(name, record.get_node_count()))
+
+    def load_graph(self):
+        print("Saved graphs: {}".format(", ".join(persistent_storage.get_graph_names())))
+        name = input("Which graph should I load? ")
+        if not name:
+            return
+        if persistent_storage.load_graph(name, self.nav_graph) is None:
+            print("{}No graph called '{}'.".format(config.strings.error_prefix, name))
+
     def analyze_path(self):
         analysis = self.analyzer.score_path()
         ratio = float("inf") if analysis.base_cost == 0 else round(analysis.expected_cost/analysis.base_cost, 3)
@@ -89,7 +111,10 @@ class MainWindow(BaseWindow):
             return Node.State(value)
 
     def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
-        node = self.nav_graph.get_node_from_position((x, y))
+        # Scrolling over a node changes its state, elsewhere it zooms
+        node = self.nav_graph.get_node_from_position(self.camera.screen_to_world((x, y)))
+        if node is None:
+            self.camera.zoom_at((x, y), config.window.zoom_step ** scroll_y)
         if node:
             self.accumulated_scroll_y += scroll_y
             if abs(self.accumulated_scroll_y) > 1:
@@ -104,8 +129,12 @@ class MainWindow(BaseWindow):
         return -point[0], -point[1]
 
     def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+        x, y = self.camera.screen_to_world((x, y))
         if buttons & mouse.MIDDLE:
-            if self.dragged_nodes:
+            if not self.dragged_nodes:
+                # Dragging without selected nodes pans the view
+                self.camera.pan(dx, dy)
+            else:
                 for i in range(len(self.dragged_nodes)):
                     start_pos = self.dragged_node_start_positions[i]
                     node = self.dragged_nodes[i]
@@ -123,6 +152,7 @@ class MainWindow(BaseWindow):
             reset_node_dragging()
 
     def on_mouse_press(self, x, y, button, modifiers):
+        x, y = self.camera.screen_to_world((x, y))
         position = x, y
         node = self.nav_graph.get_node_from_position((x, y))
         selected_nodes = self.nav_graph.get_selected_nodes()
@@ -214,6 +244,8 @@ class MainWindow(BaseWindow):
     def on_key_press(self, symbol, modifiers):
         if symbol == key.A:
             self.draw_background = not self.draw_background
+        if symbol == key.HOME:
+            self.camera.reset()
         if symbol == key.SPACE:
             self.nav_graph.start_pathfinding()
         if symbol == key.G:
@@ -244,13 +276,12 @@ class MainWindow(BaseWindow):
             self.nav_graph.pathfinder.refresh_path()
         if symbol == key.M:
             if Plib.is_ctrl(modifiers):
-                my_inp = input("What should I call the current graph?")
-                print("You typed {}. Is that correct?".format(my_inp))
-                yn = input("y/n:")
-                print("{} it is.".format(yn))
-                pass
+                self.save_graph()
         if symbol == key.O:
-            self.nav_graph.agency.create_new_set(n_evils=1, reset_path=False)
+            if Plib.is_ctrl(modifiers):
+                self.load_graph()
+            else:
+                self.nav_graph.agency.create_new_set(n_evils=1, reset_path=False)
         if symbol == key.P:
             self.nav_graph.agency.create_new_set(n_evils=1, reset_path=True)
         if symbol == key.L:
@@ -259,4 +290,4 @@ class MainWindow(BaseWindow):
     def on_resize(self, width, height):
         self.background_image.width = width
         self.background_image.height = height
-        pass
+        self.camera.set_size(width, height)
@@ -18,6 +18,7 @@ class Configurations():
             self.resource_path = 'app/resources'
             self.sqlite3_filename = 'db/sqlite3_pretreat.db'
             self.zodb_filename = 'zodb.fs'
+            self.zodb_graphs_key = 'graphs'
             self.plot_save_filename = "weighted_graph.png"
             self.icon_folder = 'icons/map1'
             self.icons_paths = []  # Will be populated below
@@ -44,6 +45,9 @@ class Configurations():
             self.default_height = 720
             self.desired_fps = 60.0
             self.aa_samples = 2
+            self.min_zoom = 0.02
+            self.max_zoom = 8.0
+            self.zoom_step = 1.1    # Zoom factor per scroll step
 
     class World():
         class ZIndexes():
@@ -53,6 +57,7 @@ class Configurations():
                 self.node = -100
                 self.node_path = self.node-10
                 self.agent = 0
+                self.label = 100000
 
         def __init__(self):
             self.size_x = 18
@@ -69,6 +74,8 @@ class Configurations():
             self.min_altitude = 1
             self.max_altitude = 100
             self.rand_altitude_factor = 0.3
+            self.use_altitude_map = False       # Sample node altitudes from strings.altitude_map
+            self.interpolate_altitude = True    # Bilinear interpolation between altitude map pixels
             self.min_degree = 2
             self.max_degree = 2
             self.base_edge_chance = 1
@@ -111,9 +118,18 @@ class Configurations():
             self.edge_triangles_width = 4*self.edge_thickness
             self.edge_lane_offset = max(self.edge_thickness, self.edge_triangles_width)*0.4
             self.adjust_edge_to_selection = True
+            self.circle_segment_tolerance = 0.2     # Max pixels between a circle and its polygon
+            self.min_circle_segments = 8
+            self.max_circle_segments = 64
+            # Level of detail: zoom levels below which edges, edge arrows and node labels are not drawn
+            self.lod_edge_zoom = 0.15
+            self.lod_arrow_zoom = 0.75
+            self.lod_label_zoom = 0.5
 
             self.default_rand_seed = 13
             self.blocked_node_edge_cost = float("inf")
+            self.landmark_count = 8     # Landmarks of the ALT heuristic
+            self.path_cache_size = 256  # Start-destination pairs whose shortest path is kept
             self.edge_refresh_interval = 1.0/60
             self.pathfinder_refresh_interval = 1.0/60
             self.agent_step_interval = 2  # seconds
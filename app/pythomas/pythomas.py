@@ -64,19 +64,46 @@ def interpolate_point(from_point, to_point, fraction):  # fraction is float in r
     return x, y
 
 
+_unit_circles = dict()
+_unit_triangle = np.array([(-0.5, 0.0), (0.5, 0.0), (0.0, 1.0)])    # Base left, base right, tip
+_unit_triangle.flags.writeable = False
+
+
+def get_unit_circle_points(number_of_points=32, include_center=False, repeat=True):
+    # Cached (n, 2) array of points on the unit circle. Shapes scale and translate it instead of computing the trig.
+    key = number_of_points, include_center, include_center and repeat
+    points = _unit_circles.get(key)
+    if points is None:
+        angles = 2.0*math.pi*np.arange(number_of_points)/number_of_points
+        points = np.column_stack([np.cos(angles), np.sin(angles)])
+        if include_center and repeat:
+            points = np.vstack([points, points[:1]])
+        if include_center:
+            points = np.vstack([(0.0, 0.0), points])
+        points.flags.writeable = False
+        _unit_circles[key] = points
+    return points
+
+
+def get_circle_segment_count(radius):
+    # Fewest segments, in steps of 4, whose polygon is within circle_segment_tolerance of a circle of the
+    # given on-screen radius
+    world = config.world
+    if radius <= world.circle_segment_tolerance:
+        return world.min_circle_segments
+    n = math.pi / math.acos(1 - world.circle_segment_tolerance/radius)
+    n = 4 * math.ceil(n / 4)
+    return int(min(max(n, world.min_circle_segments), world.max_circle_segments))
+
+
 def get_circle_points(center=(0.0, 0.0), radius=10.0, number_of_points=32, include_center=False, repeat=True):
-    points_list = []
-    for i in range(number_of_points):
-        a = 2.0*math.pi*float(i)/number_of_points
-        points_list.append(center[0]+radius*math.cos(a))
-        points_list.append(center[1]+radius*math.sin(a))
-    if include_center and repeat:
-        points_list.append(points_list[0])
-        points_list.append(points_list[1])
-    if include_center:
-        points_list.insert(0, center[0])
-        points_list.insert(1, center[1])
-    return points_list
+    points = get_unit_circle_points(number_of_points, include_center, repeat) * radius + center
+    return points.ravel().tolist()
+
+
+def get_unit_triangle_points():
+    # Read-only (3, 2) array of a triangle with base width and height 1, base center in origo and tip up
+    return _unit_triangle
 
 
 def flatten_list_of_tuples(list_of_tuples):
@@ -189,6 +216,44 @@ def get_point_on_circle(circle_center, radius, line_point, direction_point):
     return point
 
 
+def get_points_on_circles(circle_centers, radii, line_points, direction_points):
+    # Vectorized get_point_on_circle for n circles and lines given as (n, 2) arrays.
+    # Of the two intersections, the one closest to the direction point is used. Rows without one are nan.
+    centers = np.asarray(circle_centers, dtype=np.float64).reshape(-1, 2)
+    line_points = np.asarray(line_points, dtype=np.float64).reshape(-1, 2)
+    direction = np.asarray(direction_points, dtype=np.float64).reshape(-1, 2) - line_points
+    radii = np.asarray(radii, dtype=np.float64)
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unit = direction / length[:, None]
+        w = line_points - centers
+        b = (w * unit).sum(axis=1)
+        c = (w * w).sum(axis=1) - radii * radii
+        discriminant = b * b - c
+        root = np.sqrt(np.where(discriminant >= 0, discriminant, np.nan))
+        t1 = -b + root
+        t2 = -b - root
+        t = np.where(np.abs(t1 - length) <= np.abs(t2 - length), t1, t2)
+    return line_points + unit * t[:, None]
+
+
+def get_rectangle_corners(start_points, end_points, height):
+    # Corners of n rectangles of the given height from start to end points, as an (n, 4, 2) array.
+    # Same corner order as Rectangle.create_draw_points.
+    start_points = np.asarray(start_points, dtype=np.float64).reshape(-1, 2)
+    end_points = np.asarray(end_points, dtype=np.float64).reshape(-1, 2)
+    difference = end_points - start_points
+    length = np.hypot(difference[:, 0], difference[:, 1])
+    normal = np.zeros_like(difference)
+    normal[:, 1] = 1.0  # atan2(0, 0) is 0
+    nonzero = length > 0
+    normal[nonzero, 0] = -difference[nonzero, 1] / length[nonzero]
+    normal[nonzero, 1] = difference[nonzero, 0] / length[nonzero]
+    half_height = normal * (np.asarray(height, dtype=np.float64).reshape(-1, 1) / 2)
+    return np.stack([start_points + half_height, start_points - half_height,
+                     end_points - half_height, end_points + half_height], axis=1)
+
+
 def get_point_in_direction(distance, start_position, point_in_direction, stop_at_target=False):
     if distance is None or start_position is None or point_in_direction is None:
         raise Exception("Foo Bar!")
@@ -282,6 +347,13 @@ def rotate_list_of_points_around_point(list_of_points, axis_point, theta):
     return list_of_rotated_points
 
 
+def rotate_points_around_point(points, axis_point, radians_theta):
+    # Rotates an (n, 2) array of points in one array operation
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    axis = np.asarray(axis_point[:2], dtype=np.float64)
+    return (points - axis).dot(get_rotation_matrix(radians_theta).T) + axis
+
+
 def rotate_point_around_point(point, axis_point, radians_theta):
     theta = radians_theta
     x, y = point[0], point[1]
@@ -328,8 +400,8 @@ def divide_points(p, q):
 colors = config.colors
 
 
+# pyglet.window is only loaded by the first key lookup, so importing this module does not need a display
 import pyglet
-from pyglet.window import key
 
 
 # pyglet-specific library
@@ -341,27 +413,27 @@ class PygletLib:
 
     @staticmethod
     def is_shift(modifiers):
-        return modifiers & (key.LSHIFT | key.RSHIFT)
+        return modifiers & (pyglet.window.key.LSHIFT | pyglet.window.key.RSHIFT)
 
     @staticmethod
     def is_shift_pressed(pressed_keys):
-        return pressed_keys[key.LSHIFT] or pressed_keys[key.RSHIFT]
+        return pressed_keys[pyglet.window.key.LSHIFT] or pressed_keys[pyglet.window.key.RSHIFT]
 
     @staticmethod
     def is_ctrl(modifiers):
-        return modifiers & (key.LCTRL | key.RCTRL)
+        return modifiers & (pyglet.window.key.LCTRL | pyglet.window.key.RCTRL)
 
     @staticmethod
     def is_ctrl_pressed(pressed_keys):
-        return pressed_keys[key.LCTRL] or pressed_keys[key.RCTRL]
+        return pressed_keys[pyglet.window.key.LCTRL] or pressed_keys[pyglet.window.key.RCTRL]
 
     @staticmethod
     def is_alt(modifiers):
-        return modifiers & (key.LALT | key.RALT)
+        return modifiers & (pyglet.window.key.LALT | pyglet.window.key.RALT)
 
     @staticmethod
     def is_alt_pressed(pressed_keys):
-        return pressed_keys[key.LALT] or pressed_keys[key.RALT]
+        return pressed_keys[pyglet.window.key.LALT] or pressed_keys[pyglet.window.key.RALT]
 
     @staticmethod
     def toggle_fullscreen(window):
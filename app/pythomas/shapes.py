@@ -1,11 +1,61 @@
 import math
+import ctypes
+import numpy as np
 import pyglet
 from app.pythomas import pythomas as lib
 from app.config import config
 
 
+# pyglet.gl and pyglet.graphics are only imported once a shape is created, so importing this module
+# does not need a display
+_layer_groups = dict()
+_triangle_indices = dict()
+_view_scale = 1.0
+
+
+def set_view_scale(scale):
+    # Zoom of the view, so circles are tessellated for their on-screen radius
+    global _view_scale
+    _view_scale = scale
+
+
+def get_layer_group(z):
+    # One group per z-index shared by all shapes in it. Batched shapes are all indexed GL_TRIANGLES in the
+    # same vertex format, so pyglet packs each layer into one vertex and index buffer and draws it in one call.
+    group = _layer_groups.get(z)
+    if group is None:
+        group = _layer_groups[z] = pyglet.graphics.OrderedGroup(z)
+    return group
+
+
+def get_triangle_indices(mode, number_of_vertices):
+    # Indices that draw vertices laid out for mode as GL_TRIANGLES
+    key = mode, number_of_vertices
+    indices = _triangle_indices.get(key)
+    if indices is not None:
+        return indices
+    gl = pyglet.gl
+    n = number_of_vertices
+    if mode == gl.GL_TRIANGLES:
+        indices = list(range(n - n % 3))
+    elif mode == gl.GL_QUADS:
+        indices = []
+        for i in range(0, n - 3, 4):
+            indices.extend((i, i+1, i+2, i, i+2, i+3))
+    elif mode == gl.GL_TRIANGLE_STRIP:
+        indices = []
+        for i in range(n - 2):
+            indices.extend((i, i+1, i+2) if i % 2 == 0 else (i+1, i, i+2))
+    else:   # GL_TRIANGLE_FAN and convex GL_POLYGON
+        indices = []
+        for i in range(1, n - 1):
+            indices.extend((0, i, i+1))
+    indices = _triangle_indices[key] = tuple(indices)
+    return indices
+
+
 class Shape(object):
-    def __init__(self, position, color=None, color_list=None, mode=pyglet.gl.GL_POLYGON, anchor=None,
+    def __init__(self, position, color=None, color_list=None, mode=None, anchor=None,
                  batch=None, group=None, z=0):
         self.x = position[0]
         self.y = position[1]
@@ -14,19 +64,22 @@ class Shape(object):
         self.vertex_list = None  # self.create_vertex_list()
         if False:
             self.vertex_list = pyglet.graphics.vertex_list(0, None)
+        # Vertices as an (n, 2) array. Transforms update it and write it to the vertex list in one assignment.
+        self.points = None
         self.translate = None
         self.color_list = [] if not color_list else color_list
         self.color = color
         if color:
             self.color_list = None
-        self.mode = mode
+        self.mode = mode if mode is not None else pyglet.gl.GL_POLYGON
         self.rotation_anchor = self.get_position() if not anchor else anchor
         self.batch = batch
-        self.batch_group = pyglet.graphics.OrderedGroup(self.z)
+        self.batch_group = get_layer_group(self.z) if group is None else group
         self.added_to_batch = False
         self.is_initialized = False
+        self.visible = True
 
-    def set_batch(self, batch, group=pyglet.graphics.Group()):
+    def set_batch(self, batch, group=None):
         dirty = False
         if batch and batch is not self.batch:
             self.batch = batch
@@ -38,7 +91,7 @@ class Shape(object):
 
     def set_z(self, z):
         self.z = z
-        self.batch_group = pyglet.graphics.OrderedGroup(z)
+        self.batch_group = get_layer_group(z)
         self.update_shape(dirty=True)
 
     # Does NOT work: batch.add(count, mode, group, *data)
@@ -52,17 +105,36 @@ class Shape(object):
             self.vertex_list.delete()
             self.vertex_list = None
 
+    def set_visible(self, visible):
+        # A hidden shape keeps its state but leaves its batch, so batch.draw() skips it. It is added again when shown.
+        if visible == self.visible:
+            return
+        self.visible = visible
+        if not visible:
+            if self.vertex_list:
+                self.vertex_list.delete()
+                self.vertex_list = None
+        elif self.is_initialized:
+            self.update_shape(dirty=True)
+
+    def write_vertices(self):
+        if not self.vertex_list or self.points is None:
+            return
+        vertices = self.vertex_list.vertices
+        if isinstance(vertices, ctypes.Array):
+            np.ctypeslib.as_array(vertices)[:] = self.points.ravel()
+        else:   # Interleaved attributes are not backed by one contiguous array
+            vertices[:] = self.points.ravel().tolist()
+
     def set_position(self, new_position):
         x, y = new_position
         dx, dy = x - self.x, y - self.y
         self.x = x
         self.y = y
         self.set_anchor(lib.sum_points((dx, dy), self.rotation_anchor))
-        if self.vertex_list:
-            for i in range(self.vertex_list.count):
-                xi, yi = 2*i, 2*i+1
-                self.vertex_list.vertices[xi] += dx
-                self.vertex_list.vertices[yi] += dy
+        if self.points is not None and (dx or dy):
+            self.points += (dx, dy)
+            self.write_vertices()
 
     def move(self, dx, dy):
         self.set_position(lib.sum_points(self.get_position(), (dx, dy)))
@@ -72,15 +144,15 @@ class Shape(object):
 
     def rotate(self, theta, anchor_point=None):
         anchor_point = anchor_point if anchor_point else self.rotation_anchor
-        rotated_points = []
-        for point_index in range(self.vertex_list.count):
-            x = self.vertex_list.vertices[0 + 2*point_index]
-            y = self.vertex_list.vertices[1 + 2*point_index]
-            point = x, y
-            rotated_points.extend(lib.rotate_point_around_point(point, anchor_point, theta))
-        self.vertex_list.vertices = rotated_points
+        self.points = lib.rotate_points_around_point(self.points, anchor_point, theta)
+        self.write_vertices()
         return self.vertex_list.vertices
 
+    def scale(self, factor, anchor_point=None):
+        anchor_point = np.asarray(anchor_point if anchor_point else self.rotation_anchor, dtype=np.float64)
+        self.points = (self.points - anchor_point) * factor + anchor_point
+        self.write_vertices()
+
     def create_draw_points(self):
         return None
 
@@ -121,22 +193,27 @@ class Shape(object):
             points = []
         if points is None:
             return None
-        number_of_vertices = int(len(points)/2)
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        number_of_vertices = len(self.points)
         self.update_color_list(number_of_vertices)
 
         if self.vertex_list:
             self.vertex_list.delete()
             self.vertex_list = None
+        if not self.visible:
+            return None
         if self.batch:
-            data = (config.world.vertex_mode, tuple(points)), \
+            data = (config.world.vertex_mode, self.points.ravel().tolist()), \
                    (config.world.color_mode, tuple(self.color_list))
-            group = pyglet.graphics.Group(pyglet.graphics.OrderedGroup(self.z))
-            # self.vertex_list = self.batch.add(number_of_vertices, self.mode, self.batch_group, *data)
-            self.vertex_list = self.batch.add(number_of_vertices, self.mode, group, *data)
+            indices = get_triangle_indices(self.mode, number_of_vertices)
+            self.vertex_list = self.batch.add_indexed(number_of_vertices, pyglet.gl.GL_TRIANGLES, self.batch_group,
+                                                      indices, *data)
         else:
             self.vertex_list = pyglet.graphics.vertex_list(number_of_vertices,
                                                            config.world.vertex_mode,
                                                            config.world.color_mode)
+            self.write_vertices()
+            self.vertex_list.colors = self.color_list
         return self.vertex_list
 
     def update_shape(self, dirty=False):
@@ -147,7 +224,7 @@ class Shape(object):
             self.is_initialized = True
 
     def draw(self, batch=None):
-        # TODO: Fix batched draw
+        # With a batch, the shape is added to it once and drawn by batch.draw()
         if self.vertex_list is None:
             return
         if batch and not self.batch:
@@ -158,25 +235,37 @@ class Shape(object):
             self.vertex_list.draw(self.mode)
 
     def get_centroid(self):
-        return lib.average_list_of_points(
-            lib.get_list_of_points_from_list_of_coordinates(self.vertex_list.vertices, self.vertex_list.count)
-        )
+        return tuple(self.points.mean(axis=0).tolist())
 
 
 class Circle(Shape):
     def __init__(self, position, radius, color, batch=None, z=0):
         Shape.__init__(self, position, color, mode=pyglet.gl.GL_TRIANGLE_FAN, batch=batch, z=z)
         self.radius = radius
+        self.number_of_points = None
         self.update_shape()
 
+    def get_number_of_points(self):
+        return lib.get_circle_segment_count(self.radius * _view_scale)
+
     def create_draw_points(self):
-        return lib.get_circle_points(center=(self.x, self.y),
-                                     radius=self.radius,
-                                     include_center=True)
+        self.number_of_points = self.get_number_of_points()
+        return lib.get_unit_circle_points(self.number_of_points, include_center=True) * self.radius + (self.x, self.y)
 
     def set_radius(self, radius):
         if radius >= 0.0 and radius != self.radius:
             self.radius = radius
+            if self.points is None or self.get_number_of_points() != self.number_of_points:
+                self.update_shape(dirty=True)
+                return
+            # Same tessellation, so the existing vertex list is scaled in place
+            self.points = lib.get_unit_circle_points(self.number_of_points, include_center=True) * radius \
+                + (self.x, self.y)
+            self.write_vertices()
+
+    def update_tessellation(self):
+        # Rebuilds the circle if its on-screen radius calls for another number of segments, e.g. after zooming
+        if self.get_number_of_points() != self.number_of_points:
             self.update_shape(dirty=True)
 
     def expand_radius(self, value):
@@ -201,6 +290,22 @@ class Rectangle(Shape):
         self.height = radius
         self.update_shape()
 
+    def set_end_points(self, start_point, end_point, corners=None):
+        # Moves and stretches the rectangle in its existing vertex list. The corners may be precomputed,
+        # e.g. with lib.get_rectangle_corners for many rectangles at once.
+        self.start_point = start_point
+        self.end_point = end_point
+        self.x, self.y = lib.get_middle(start_point, end_point)
+        self.set_anchor(self.get_position())
+        self.width = lib.get_point_distance(start_point, end_point)
+        if self.points is None:
+            self.update_shape(dirty=True)
+            return
+        if corners is None:
+            corners = lib.get_rectangle_corners(start_point, end_point, self.height)
+        self.points = np.array(corners, dtype=np.float64).reshape(4, 2)
+        self.write_vertices()
+
     @staticmethod
     def create_centerd_on(position, width, height=None, theta=0, colors_list=None, color=None, batch=None):
         height = width if not height else height
@@ -219,12 +324,7 @@ class Rectangle(Shape):
         x2 = self.end_point[0]
         y2 = self.end_point[1]
         theta = math.atan2(y2-y1, x2-x1)
-        rotated_rectangle_points = []
-        self_position = self.get_position()
-        for p in rectangle_points:
-            rotated_p = lib.rotate_point_around_point(p, self_position, theta)
-            rotated_rectangle_points.extend(rotated_p)
-        return rotated_rectangle_points
+        return lib.rotate_points_around_point(rectangle_points, self.get_position(), theta).ravel()
 
 
 class Triangle(Shape):
@@ -244,13 +344,8 @@ class Triangle(Shape):
                              colors_list=None, color=None, z=0):
         if height is None:
             height = base_width * 0.866  # math.sqrt(3)/2
-        base_left = centroid[0] - base_width/2, centroid[1]
-        base_right = centroid[0] + base_width/2, centroid[1]
-        tip = centroid[0], centroid[1] + height
-        desired_centroid = centroid
-        current_centroid = lib.average_list_of_points([base_right, base_left, tip])
-        offset = lib.subtract_points(current_centroid, desired_centroid)
-        position = lib.subtract_points(centroid, offset)
+        # The centroid is a third of the height above the base center
+        position = centroid[0], centroid[1] - height/3
         triangle = Triangle(position, base_width, height, rotation,
                             colors_list, color, anchor=centroid, z=z)
         triangle.set_anchor(centroid)
@@ -258,16 +353,21 @@ class Triangle(Shape):
 
     def create_draw_points(self):
         default_rotation = math.pi / 2
-        base_left = self.x - self.width/2, self.y
-        base_right = self.x + self.width/2, self.y
-        tip = self.x, self.y + self.height
-        triangle_points = [base_left, base_right, tip]
-        rotated_triangle_points = []
-        anchor = self.rotation_anchor
-        for p in triangle_points:
-            rotated_p = lib.rotate_point_around_point(p, anchor, self.rotation - default_rotation)
-            rotated_triangle_points.extend(rotated_p)
-        return rotated_triangle_points
+        triangle_points = lib.get_unit_triangle_points() * (self.width, self.height) + (self.x, self.y)
+        return lib.rotate_points_around_point(triangle_points, self.rotation_anchor,
+                                              self.rotation - default_rotation)
+
+    def set_centroid(self, centroid, rotation=None):
+        # Moves and turns the triangle in its existing vertex list
+        if rotation is not None:
+            self.rotation = rotation
+        self.x, self.y = centroid[0], centroid[1] - self.height/3
+        self.set_anchor(centroid)
+        if self.points is None:
+            self.update_shape(dirty=True)
+            return
+        self.points = self.create_draw_points()
+        self.write_vertices()
 
     def set_height(self, height):
         self.height = height
@@ -298,6 +398,14 @@ class OutlinedCircle(Circle):
         super(OutlinedCircle, self).move(dx, dy)
         self.outlined_shape.move(dx, dy)
 
+    def set_visible(self, visible):
+        super(OutlinedCircle, self).set_visible(visible)
+        self.outlined_shape.set_visible(visible)
+
+    def update_tessellation(self):
+        super(OutlinedCircle, self).update_tessellation()
+        self.outlined_shape.update_tessellation()
+
     def set_radius(self, radius):
         super(OutlinedCircle, self).set_radius(radius)
         self.outlined_shape.set_radius(radius + self.border)
@@ -17,4 +17,6 @@
 
 from app import app
 
-app.run()
+# Guarded so that worker processes of the console sweep can import this module
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,53 @@
+#
+# Copyright (C) 2015 Thomas Fauskanger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Usage:
+#   python run_benchmarks.py -o new.json
+#   python run_benchmarks.py -o new.json --compare old.json --threshold 0.1
+# Exits with status 1 when a benchmark is slower than in the compared file.
+
+import argparse
+import sys
+
+from app.classes.benchmark import BenchmarkSuite
+
+
+def parse_size(text):
+    n_rows, n_cols = text.lower().split('x')
+    return int(n_rows), int(n_cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time pathfinding, analysis and simulation hot paths.')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(10, 10), (20, 20), (40, 40)],
+                        help='Grid sizes as ROWSxCOLS')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed operations per benchmark')
+    parser.add_argument('--only', nargs='+', choices=BenchmarkSuite.benchmark_names, help='Benchmarks to run')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON file to write')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed relative growth of median time')
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(sizes=args.sizes, repeat=args.repeat, names=args.only)
+    suite.run()
+    suite.save(args.output)
+    if args.compare and suite.compare(args.compare, threshold=args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()